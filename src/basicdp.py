@@ -1,9 +1,92 @@
 import numpy as np
-from random import choice
+from itertools import islice, izip
 import gmpy2
+from composition import advanced
+from rng import get_rng, randint
 
 
-def noisy_max(data, domain, quality_function, eps, bulk=False):
+def __qualify_domain__(data, domain, quality_function, bulk=False):
+    """
+    evaluate the quality of every element in the domain
+    :param data: list or array of values
+    :param domain: list of possible results
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
+    quality function get the whole domain as input
+    :return: numpy array of floats. the i-th value is the quality of the i-th element of the domain
+    """
+    if bulk:
+        qualified_domain = quality_function(data, domain)
+    else:
+        qualified_domain = [quality_function(data, d) for d in domain]
+    # qualities given as 1-element arrays (e.g. noisy qualities) are flattened as well
+    return np.asarray(qualified_domain, dtype=float).reshape(-1)
+
+
+def __exponential_cdf__(qualities, eps):
+    """
+    the (un-normalized) CDF of the exponential mechanism. the probability of the i-th element
+    is proportional to exp(eps*qualities[i]/2).
+    the computation is done in log-space: the weights are shifted by the maximal one before exponentiation,
+    so very large (or very small) qualities neither overflow nor vanish
+    :param qualities: numpy array of qualities
+    :param eps: privacy parameter
+    :return: the accumulated shifted weights and the natural log of the total (un-normalized) weight
+    """
+    if not len(qualities):
+        raise ValueError('domain is empty')
+    log_pdf = eps * qualities / 2.0
+    shift = np.max(log_pdf)
+    domain_cdf = np.cumsum(np.exp(log_pdf - shift))
+    return domain_cdf, shift + np.log(domain_cdf[-1])
+
+
+def __sample_cdf__(domain_cdf, rng, size=None):
+    """
+    pick uniformly random values on the CDF and return the indexes corresponding to them
+    :param domain_cdf: accumulated (un-normalized) weights
+    :param rng: random generator
+    :param size: number of independent picks. if None a single index is returned
+    :return: index or numpy array of indexes
+    """
+    picks = rng.uniform(0, domain_cdf[-1], size)
+    # take the min between the index and len(D)-1 to prevent returning index out of bound
+    return np.minimum(np.searchsorted(domain_cdf, picks, side='right'), len(domain_cdf) - 1)
+
+
+def __exponential_sample__(qualities, eps, rng):
+    """
+    the sampling engine of the exponential mechanism
+    samples an index i with probability proportional to exp(eps*qualities[i]/2)
+    :param qualities: numpy array of qualities
+    :param eps: privacy parameter
+    :param rng: random generator
+    :return: the sampled index and the natural log of the total (un-normalized) weight
+    """
+    domain_cdf, log_total_value = __exponential_cdf__(qualities, eps)
+    return int(__sample_cdf__(domain_cdf, rng)), log_total_value
+
+
+def __report_noise__(noise, eps, size, rng):
+    """
+    noise for the report-noisy-max mechanisms
+    :param noise: 'laplace' for Lap(1/eps) or 'exponential' for the one-sided Exp(1/eps) noise
+    :param eps: privacy parameter
+    :param size: number of independent noise values
+    :param rng: random generator
+    :return: numpy array of noise values
+    """
+    noise_switch = {
+        'laplace': lambda: rng.laplace(0, 1 / eps, size),
+        'exponential': lambda: rng.exponential(1 / eps, size),
+    }
+    if noise not in noise_switch:
+        raise ValueError("unknown noise type: '%s'" % noise)
+    return noise_switch[noise]()
+
+
+def noisy_max(data, domain, quality_function, eps, bulk=False, noise='laplace', return_gap=False, rng=None):
     """Noisy-Max Mechanism
     noisy_max ( data , domain, quality function , privacy parameter )
     :param data: list or array of values
@@ -13,21 +96,28 @@ def noisy_max(data, domain, quality_function, eps, bulk=False):
     :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
     the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
     quality function get the whole domain as input
+    :param noise: 'laplace' (default) to add Lap(1/eps) noise, or 'exponential' to add one-sided Exp(1/eps) noise
+    :param return_gap: if True returns also the gap between the highest and the second-highest noisy qualities
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
     """
 
     # compute q(X,i) for all the elements in D
-    if bulk:
-        qualified_domain = quality_function(data, domain)
-    else:
-        qualified_domain = [quality_function(data, i) for i in domain]
-    # add Lap(1/eps) noise for each element in qualified_domain
-    noisy = [q + np.random.laplace(0, 1 / eps, 1) for q in qualified_domain]
+    qualified_domain = __qualify_domain__(data, domain, quality_function, bulk)
+    # add noise for each element in qualified_domain
+    noisy = qualified_domain + __report_noise__(noise, eps, len(qualified_domain), get_rng(rng))
     # return element with maximum noisy q(X,i)
-    return domain[noisy.index(max(noisy))]
+    index = int(np.argmax(noisy))
+    if return_gap:
+        if len(noisy) > 1:
+            gap = noisy[index] - np.partition(noisy, -2)[-2]
+        else:
+            gap = np.inf
+        return domain[index], gap
+    return domain[index]
 
 
-def exponential_mechanism(data, domain, quality_function, eps, bulk=False, for_sparse=False):
+def exponential_mechanism(data, domain, quality_function, eps, bulk=False, for_sparse=False, rng=None):
     """Exponential Mechanism
     exponential_mechanism ( data , domain , quality function , privacy parameter )
     :param data: list or array of values
@@ -40,64 +130,323 @@ def exponential_mechanism(data, domain, quality_function, eps, bulk=False, for_s
     :param for_sparse: in cases that the domain is a very spared one, namely a big percent of the domain has quality 0,
     there is a special procedure called sparse_domain. That procedure needs, beside that result from the given
     mechanism, the total weight of the domain whose quality is more than 0. If that is the case Exponential-Mechanism
-    will return also the P DF before the normalization.
+    will return also the P DF before the normalization (as a gmpy2 mpfr number).
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
     """
 
-    # calculate a list of probabilities for each element in the domain D
-    # probability of element d in domain proportional to exp(eps*quality(data,d)/2)
-    if bulk:
-        qualified_domain = quality_function(data, domain)
-        domain_pdf = [np.exp(eps * q / 2) for q in qualified_domain]
-    else:
-        domain_pdf = [np.exp(eps * quality_function(data, d) / 2) for d in domain]
-    total_value = float(sum(domain_pdf))
-    domain_pdf = [d / total_value for d in domain_pdf]
-    normalizer = sum(domain_pdf)
-    # for debugging and other reasons: check that domain_cdf indeed defines a distribution
-    # use the uniform distribution (from 0 to 1) to pick an elements by the CDF
-    if abs(normalizer - 1) > 0.001:
-        raise ValueError('ERR: exponential_mechanism, sum(domain_pdf) != 1.')
-
-    # accumulate elements to get the CDF of the exponential distribution
-    domain_cdf = np.cumsum(domain_pdf).tolist()
-    # pick a uniformly random value on the CDF
-    pick = np.random.uniform()
-
-    # return the index corresponding to the pick
-    # take the min between the index and  len(D)-1 to prevent returning index out of bound
-    result = domain[min(np.searchsorted(domain_cdf, pick), len(domain)-1)]
+    qualified_domain = __qualify_domain__(data, domain, quality_function, bulk)
+    index, log_total_value = __exponential_sample__(qualified_domain, eps, get_rng(rng))
+    result = domain[index]
     # in exponential_mechanism_sparse we need also the total_sum value
+    # the total weight overflows a float for large qualities, so it is returned as an arbitrary precision number
     if for_sparse:
-        return result, total_value
+        return result, gmpy2.exp(log_total_value)
     return result
 
 
-def __pick_out_of_sub_group__(group, subgroup):
+def exponential_mechanism_segments(data, segments, quality_function, eps, rng=None):
+    """Exponential Mechanism over a domain of integer segments
+    the domain is given as segments of consecutive integers [start, start + length) on which the quality is constant,
+    so it is never materialized - e.g. ranges of 2^60 integers in which the quality changes only at the data points.
+    a segment is chosen with probability proportional to length*exp(eps*quality/2) and then an element out of it
+    uniformly, which is exactly the exponential mechanism over all the elements of the segments
+    (elements which appear in several segments are counted for every one of them)
+    :param data: list or array of values
+    :param segments: two lists or numpy arrays of integers - the starts of the segments and their lengths
+    :param quality_function: bulk quality function. gets as input the data and a numpy array of segment starts
+    :param eps: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: an element of the segments with approximately maximum value of quality function
+    """
+    starts, lengths = np.asarray(segments[0], np.int64), np.asarray(segments[1], np.int64)
+    starts, lengths = starts[lengths > 0], lengths[lengths > 0]
+    qualified_segments = __qualify_domain__(data, starts, quality_function, True)
+    rng = get_rng(rng)
+    # a segment of length l weighs like l elements: l*exp(eps*q/2) = exp(eps*(q + 2*log(l)/eps)/2)
+    index, _ = __exponential_sample__(qualified_segments + 2 * np.log(lengths) / eps, eps, rng)
+    return int(starts[index] + randint(rng, lengths[index]))
+
+
+def prepared_exponential_mechanism(data, domain, quality_function, eps, bulk=False, rng=None):
+    """Exponential Mechanism for repeated sampling
+    the qualities and the CDF are computed once, so every additional draw costs a single binary search.
+    note that every draw is a new execution of the exponential mechanism with respect to privacy,
+    so k draws preserve (k*eps)-differential privacy
+    :param data: list or array of values
+    :param domain: list of possible results
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param eps: privacy parameter
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
+    quality function get the whole domain as input
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: sample instance that gets k as input and returns a list of k independent results
+    of the exponential mechanism
+    """
+    qualified_domain = __qualify_domain__(data, domain, quality_function, bulk)
+    domain_cdf, _ = __exponential_cdf__(qualified_domain, eps)
+    rng = get_rng(rng)
+
+    def sample(k=1):
+        return [domain[i] for i in __sample_cdf__(domain_cdf, rng, k)]
+    return sample
+
+
+def top_k(data, domain, quality_function, eps, k, bulk=False, delta_tag=0, rng=None):
+    """One-shot Top-k Mechanism
+    adds independent Gumbel(0,1) noise to eps*quality/2 of every domain element and returns the k elements
+    with the highest noisy values. the result is distributed exactly as k rounds of the exponential mechanism
+    (each with privacy parameter eps) that remove the chosen element after every round, but the qualities
+    are evaluated only once
+    :param data: list or array of values
+    :param domain: list of possible results
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param eps: privacy parameter of a single round
+    :param k: number of elements to choose
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
+    quality function get the whole domain as input
+    :param delta_tag: additive lose in the delta parameter. if 0 (default) the reported privacy parameters are
+    the basic (pure) composition of the k rounds, (k*eps, 0). if positive, the caller accepts a delta of delta_tag,
+    and the advanced composition (eps', delta_tag) is reported instead whenever its eps' is smaller than k*eps
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: list of k distinct elements of domain ordered by their noisy quality,
+    and the privacy parameters (eps, delta) of the whole selection
+    """
+    qualified_domain = __qualify_domain__(data, domain, quality_function, bulk)
+    if not 0 < k <= len(qualified_domain):
+        raise ValueError('k must be between 1 and the domain size')
+    noisy = eps * qualified_domain / 2.0 + get_rng(rng).gumbel(0, 1, len(qualified_domain))
+    # the k highest noisy values in linear time, and only those k are sorted
+    chosen = np.argpartition(-noisy, k - 1)[:k]
+    chosen = chosen[np.argsort(-noisy[chosen])]
+    privacy = k * eps, 0
+    if delta_tag > 0:
+        advanced_privacy = advanced(eps, 0, delta_tag, k)
+        if advanced_privacy[0] < privacy[0]:
+            privacy = advanced_privacy
+    return [domain[i] for i in chosen], privacy
+
+
+def __chunks__(iterable, chunk_size):
+    """
+    split an iterable into consecutive lists
+    :param iterable: any iterable (list, xrange, generator etc.)
+    :param chunk_size: maximum length of each list
+    :return: lazy list of lists, each contains at most chunk_size consecutive items of the iterable
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def __stream_noisy_argmax__(data, domain, quality_function, noise, bulk, qualities, chunk_size):
+    """
+    single pass over the domain that keeps only the element with the highest noisy quality seen so far
+    build for the use of the streaming mechanisms
+    :param data: list or array of values
+    :param domain: iterable of possible results
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param noise: function which get a numpy array of qualities and returns their noisy version
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function which will be evaluated on every chunk of the domain
+    :param qualities: iterable of the qualities of the domain elements (in the same order). if given, the
+    quality_function is not used
+    :param chunk_size: number of domain elements which are held in memory at once
+    :return: the domain element with the maximal noisy quality
+    """
+    best, best_score = None, -np.inf
+    empty = True
+    if qualities is None:
+        chunks = ((chunk, __qualify_domain__(data, chunk, quality_function, bulk))
+                  for chunk in __chunks__(domain, chunk_size))
+    else:
+        chunks = (([d for d, _ in chunk], np.asarray([q for _, q in chunk], dtype=float).reshape(-1))
+                  for chunk in __chunks__(izip(domain, qualities), chunk_size))
+    for chunk, chunk_qualities in chunks:
+        noisy = noise(chunk_qualities)
+        index = int(np.argmax(noisy))
+        if empty or noisy[index] > best_score:
+            best, best_score = chunk[index], noisy[index]
+            empty = False
+    if empty:
+        raise ValueError('domain is empty')
+    return best
+
+
+def exponential_mechanism_stream(data, domain, quality_function, eps, bulk=False, qualities=None,
+                                 chunk_size=2**16, rng=None):
+    """Exponential Mechanism over a stream of domain elements
+    uses the Gumbel-max trick: adding independent Gumbel(0,1) noise to eps*quality/2 and taking the maximum
+    is distributed exactly as the exponential mechanism. so the domain is passed once,
+    and only chunk_size elements are held in memory at once
+    :param data: list or array of values
+    :param domain: iterable of possible results (list, xrange, generator etc.)
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param eps: privacy parameter
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function which will be evaluated on every chunk of the domain
+    :param qualities: iterable of the qualities of the domain elements (in the same order). if given, the
+    quality_function is not used
+    :param chunk_size: number of domain elements which are held in memory at once
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: an element of domain with approximately maximum value of quality function
+    """
+    rng = get_rng(rng)
+
+    def gumbel_noise(chunk_qualities):
+        return eps * chunk_qualities / 2.0 + rng.gumbel(0, 1, len(chunk_qualities))
+    return __stream_noisy_argmax__(data, domain, quality_function, gumbel_noise, bulk, qualities, chunk_size)
+
+
+def noisy_max_stream(data, domain, quality_function, eps, bulk=False, qualities=None, chunk_size=2**16,
+                     noise='laplace', rng=None):
+    """Noisy-Max Mechanism over a stream of domain elements
+    the domain is passed once, and only chunk_size elements are held in memory at once
+    :param data: list or array of values
+    :param domain: iterable of possible results (list, xrange, generator etc.)
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param eps: privacy parameter
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function which will be evaluated on every chunk of the domain
+    :param qualities: iterable of the qualities of the domain elements (in the same order). if given, the
+    quality_function is not used
+    :param chunk_size: number of domain elements which are held in memory at once
+    :param noise: 'laplace' (default) to add Lap(1/eps) noise, or 'exponential' to add one-sided Exp(1/eps) noise
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: an element of domain with approximately maximum value of quality function
+    """
+    rng = get_rng(rng)
+
+    def report_noise(chunk_qualities):
+        return chunk_qualities + __report_noise__(noise, eps, len(chunk_qualities), rng)
+    return __stream_noisy_argmax__(data, domain, quality_function, report_noise, bulk, qualities, chunk_size)
+
+
+def __random_order__(n, rng):
+    """
+    lazy random permutation of [0...n-1] - a Fisher-Yates shuffle in which only the swapped positions are kept,
+    so every index costs O(1) time and memory and the permutation is never materialized
+    build for the use of the permute_and_flip mechanism
+    :param n: number of indexes
+    :param rng: random generator
+    :return: lazy list of the indexes in a uniformly random order
+    """
+    swapped = {}
+    for i in xrange(n):
+        j = i + randint(rng, n - i)
+        index = swapped.get(j, j)
+        # position i is never drawn again, so its value moves to position j
+        swapped[j] = swapped.pop(i, i)
+        yield index
+
+
+def permute_and_flip(data, domain, quality_function, eps, max_quality=None, bulk=False, rng=None):
+    """Permute-and-Flip Mechanism
+    McKenna, Sheldon - 2020
+    visits the domain elements in a random order and accepts each with probability
+    exp(eps*(quality(data,d) - max_quality)/2). its utility is never worse than the exponential mechanism's
+    :param data: list or array of values
+    :param domain: list of possible results
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param eps: privacy parameter
+    :param max_quality: if not given, the maximal quality is computed by evaluating the whole domain, and the
+    permute-and-flip pass is made. if an upper bound on the maximal quality is given instead, a pass might end without
+    accepting any element, and repeating it would not be private. so elements are drawn uniformly with replacement
+    and accepted with the same probability - rejection sampling, which is distributed exactly as the exponential
+    mechanism. the qualities are then evaluated lazily (once for every drawn element), so for peaked quality
+    functions only a few qualities are evaluated
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
+    quality function get the whole domain as input
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: an element of domain with approximately maximum value of quality function
     """
-    Pick at random an element from subgroup
+    rng = get_rng(rng)
+    if not len(domain):
+        raise ValueError('domain is empty')
+    if max_quality is None:
+        qualified_domain = __qualify_domain__(data, domain, quality_function, bulk)
+        max_quality = np.max(qualified_domain)
+        # the element with the maximal quality is always accepted, so a single pass returns
+        for i in __random_order__(len(domain), rng):
+            if rng.uniform() <= np.exp(eps * (qualified_domain[i] - max_quality) / 2.0):
+                return domain[i]
+
+    cache = {}
+    while True:
+        i = randint(rng, len(domain))
+        if i not in cache:
+            cache[i] = __qualify_domain__(data, [domain[i]], quality_function, bulk)[0]
+        if rng.uniform() <= np.exp(eps * (cache[i] - max_quality) / 2.0):
+            return domain[i]
+
+
+def __pick_out_of_sub_group__(group, subgroup, rng=None):
+    """
+    Pick at random an element from group which is not in subgroup
     build for the use of the sparse_domain procedure
     :param group: The whole group of values
-    :param subgroup: THe sub-group of values to pick an element from
-    :return: random element of the group which is contained in the subgroup
-    """
-    pick = 0
-    good_pick = False
-    while not good_pick:
-        pick = choice(group)
-        if pick not in subgroup:
-            good_pick = True
+    :param subgroup: THe sub-group of values to avoid
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: random element of the group which is not contained in the subgroup
+    """
+    rng = get_rng(rng)
+    subgroup = set(subgroup)
+    pick = group[randint(rng, len(group))]
+    while pick in subgroup:
+        pick = group[randint(rng, len(group))]
     return pick
 
 
+def __progression_ranks__(progression, values):
+    """
+    find the ranks (indexes) of the given values in an arithmetic progression
+    build for the use of the sparse_domain procedure
+    :param progression: xrange object
+    :param values: list or array of values
+    :return: sorted numpy array with an entry for every distinct rank of the values which are elements of the
+    progression: the i-th smallest such rank minus i, which is the number of ranks of other elements below it
+    """
+    length = len(progression)
+    if not length or not len(values):
+        return np.array([], dtype=np.int64)
+    start = progression[0]
+    step = progression[1] - start if length > 1 else 1
+    offsets = np.asarray(values) - start
+    ranks = offsets // step
+    on_progression = (offsets == ranks * step) & (ranks >= 0) & (ranks < length)
+    ranks = np.unique(ranks[on_progression].astype(np.int64))
+    return ranks - np.arange(len(ranks))
+
+
+def __pick_out_of_progression__(progression, excluded_ranks, rng):
+    """
+    Pick at random an element from an arithmetic progression which is not in the excluded ranks.
+    the element is found by rank arithmetic: the m-th non-excluded element has rank m + (number of excluded
+    ranks before it), which is found by a binary search. so the progression is never materialized
+    :param progression: xrange object
+    :param excluded_ranks: the excluded ranks as returned by __progression_ranks__
+    :param rng: random generator
+    :return: random element of the progression whose rank is not excluded
+    """
+    m = randint(rng, len(progression) - len(excluded_ranks))
+    rank = m + np.searchsorted(excluded_ranks, m, side='right')
+    return progression[int(rank)]
+
+
 # TODO decide - this more generic version or a more specific one
-def sparse_domain(mechanism, data, domain, positive_value, quality_function, eps, delta=0, bulk=False):
+def sparse_domain(mechanism, data, domain, positive_value, quality_function, eps, delta=0, bulk=False, rng=None):
     """
     Wrapper for compatible mechanisms. In the case that the non-zero-quality part of the input domain is
     relatively small. The wrapper uses that information to get an improvement in run-time.
     :param mechanism: the private mechanism to be executed (such as the exponential-mechanism etc.)
     :param data: list or array of values
-    :param domain: list of possible results
+    :param domain: list of possible results. if given as an xrange (arithmetic progression) the zero-quality
+    element is picked by rank arithmetic in O(log(len(positive_value))) without materializing the domain
     :param positive_value: list of possible results with positive quality
     :param quality_function: function which get as input the data and a domain element and 'qualifies' it
     :param eps: privacy parameter
@@ -105,26 +454,86 @@ def sparse_domain(mechanism, data, domain, positive_value, quality_function, eps
     :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
     the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
     quality function get the whole domain as input
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: the result of the mechanism on the given input
     """
+    rng = get_rng(rng)
     if delta == 0:
-        r1, positives_size = mechanism(data, positive_value, quality_function, eps, bulk, for_sparse=True)
+        r1, positives_size = mechanism(data, positive_value, quality_function, eps, bulk, for_sparse=True, rng=rng)
+    else:
+        r1, positives_size = mechanism(data, positive_value, quality_function, eps, delta, bulk, for_sparse=True,
+                                       rng=rng)
+    if isinstance(domain, xrange):
+        positive_ranks = __progression_ranks__(domain, positive_value)
+        zero_size = len(domain) - len(positive_ranks)
+        if zero_size == 0:
+            return r1
+        r2 = __pick_out_of_progression__(domain, positive_ranks, rng)
     else:
-        r1, positives_size = mechanism(data, positive_value, quality_function, eps, delta, bulk, for_sparse=True)
-    r2 = __pick_out_of_sub_group__(domain, positive_value)
-    zero_size = len(domain)-len(positive_value)
-    p = float(positives_size/(zero_size + positives_size))
-    coin = np.random.binomial(1, p)
+        zero_size = len(domain) - len(positive_value)
+        if zero_size == 0:
+            return r1
+        r2 = __pick_out_of_sub_group__(domain, positive_value, rng)
+    # the total weight of the zero-quality elements is their amount. written this way so that
+    # a huge total weight of the positive elements does not turn into inf/inf
+    if positives_size == 0:
+        p = 0
+    else:
+        p = float(1 / (1 + float(zero_size) / positives_size))
+    coin = rng.binomial(1, p)
     if coin:
         return r1
     else:
         return r2
 
 
-def a_dist(data, domain, quality_function, eps, delta, bulk=False, for_sparse=False):
+def __top_two__(data, domain, quality_function, bulk, chunk_size):
+    """
+    find the domain element with the highest quality, its quality, the second-highest quality
+    and the total quality of the domain. in a single pass and without changing the domain
+    build for the use of the A_dist algorithm
+    :param data: list or array of values
+    :param domain: list, xrange or any other iterable of possible results. lists are evaluated at once,
+    xranges and other iterables are evaluated chunk by chunk keeping a running top-2
+    :param quality_function: function which get as input the data and a domain element and 'qualifies' it
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole domain in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one domain element the
+    quality function get the whole domain as input
+    :param chunk_size: number of domain elements which are held in memory at once
+    :return: h1, h1_score, h2_score, total_value
+    """
+    if hasattr(domain, '__getitem__') and not isinstance(domain, xrange):
+        chunks = [domain]
+    else:
+        chunks = __chunks__(domain, chunk_size)
+    h1, h1_score, h2_score = None, -np.inf, -np.inf
+    total_value = 0.0
+    domain_size = 0
+    for chunk in chunks:
+        qualified_chunk = __qualify_domain__(data, chunk, quality_function, bulk)
+        if not len(qualified_chunk):
+            continue
+        domain_size += len(qualified_chunk)
+        total_value += float(np.sum(qualified_chunk))
+        index = int(np.argmax(qualified_chunk))
+        if qualified_chunk[index] > h1_score:
+            if len(qualified_chunk) > 1:
+                h2_score = max(h1_score, np.partition(qualified_chunk, -2)[-2])
+            else:
+                h2_score = h1_score
+            h1, h1_score = chunk[index], qualified_chunk[index]
+        else:
+            h2_score = max(h2_score, qualified_chunk[index])
+    if domain_size < 2:
+        raise ValueError('A_dist needs at least two domain elements')
+    return h1, h1_score, h2_score, total_value
+
+
+def a_dist(data, domain, quality_function, eps, delta, bulk=False, for_sparse=False, chunk_size=2**16, rng=None):
     """A_dist algorithm
     :param data: list or array of values
-    :param domain: list of possible results
+    :param domain: list of possible results. can also be given as an xrange or any other iterable,
+    which will be passed once, chunk by chunk. the domain is not changed
     :param quality_function: sensitivity-1 quality function
     :param eps: privacy parameter
     :param delta: privacy parameter
@@ -135,22 +544,14 @@ def a_dist(data, domain, quality_function, eps, delta, bulk=False, for_sparse=Fa
     there is a special procedure called sparse_domain. That procedure needs, beside that result from the given
     mechanism, the total weight of the domain whose quality is more than 0. If that is the case A-dist
     will return also the total quality weight input domain.
+    :param chunk_size: number of domain elements which are held in memory at once when the domain is not a list
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with maximum value of quality function or 'bottom'
     """
 
-    # compute q(X,i) for all the elements in D
-    if bulk:
-        qualified_domain = quality_function(data, domain)
-    else:
-        qualified_domain = [quality_function(data, i) for i in domain]
-    total_value = float(sum(qualified_domain))
-    h1_score = max(qualified_domain)
-    h1 = domain[qualified_domain.index(h1_score)]  # h1 is domain element with highest quality
-    qualified_domain.remove(h1_score)
-    domain.remove(h1)
-    h2_score = max(qualified_domain)
-    # h2 = domain[qualified_domain.index(h2_score)]  # h2 is domain element with second-highest quality
-    noisy_gap = h1_score - h2_score + np.random.laplace(0, 1 / eps, 1)
+    # h1 is domain element with highest quality, h2_score is the second-highest quality
+    h1, h1_score, h2_score, total_value = __top_two__(data, domain, quality_function, bulk, chunk_size)
+    noisy_gap = h1_score - h2_score + get_rng(rng).laplace(0, 1 / eps, 1)
     if noisy_gap < np.log(1/delta)/eps:
         return 'bottom'
     elif for_sparse:
@@ -159,7 +560,7 @@ def a_dist(data, domain, quality_function, eps, delta, bulk=False, for_sparse=Fa
         return h1
 
 
-def above_threshold_on_queries(data, queries, threshold, eps):
+def above_threshold_on_queries(data, queries, threshold, eps, rng=None):
     """
     above_threshold algorithm - privacy preserving algorithm that given a list of sensitivity-1 queries
     tests if their evaluation over the given data exceeds the threshold
@@ -167,10 +568,11 @@ def above_threshold_on_queries(data, queries, threshold, eps):
     :param queries: list of queries
     :param threshold: fixed threshold
     :param eps: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: list of answers to the queries until the first time we get answer above the threshold
     """
 
-    initialized_threshold = above_threshold(data, threshold, eps)
+    initialized_threshold = above_threshold(data, threshold, eps, rng)
     answers = []
     for q in queries:
         query_result = initialized_threshold(q)
@@ -180,21 +582,23 @@ def above_threshold_on_queries(data, queries, threshold, eps):
     return answers
 
 
-def above_threshold(data, threshold, eps):
+def above_threshold(data, threshold, eps, rng=None):
     """
     above_threshold algorithm - privacy preserving algorithm that given a stream of sensitivity-1 queries
     tests if their evaluation over the given data exceeds the threshold
     :param data: list or array of values
     :param threshold: fixed threshold
     :param eps: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: threshold_instance that get queries as input
     and for every given query evaluate the private above-threshold test
     """
 
-    noisy_threshold = threshold + np.random.laplace(0, 2 / eps, 1)
+    rng = get_rng(rng)
+    noisy_threshold = threshold + rng.laplace(0, 2 / eps, 1)
 
     def threshold_instance(query):
-        noise = np.random.laplace(0, 4 / eps, 1)
+        noise = rng.laplace(0, 4 / eps, 1)
         if query(data) + noise >= noisy_threshold:
             return 'up'
         else:
@@ -202,8 +606,86 @@ def above_threshold(data, threshold, eps):
     return threshold_instance
 
 
+def above_threshold_batched(threshold, eps, rng=None):
+    """
+    above_threshold algorithm - privacy preserving algorithm that given a stream of sensitivity-1 queries
+    tests if their evaluation over the given data exceeds the threshold.
+    same as above_threshold, but the queries are given in batches of already evaluated answers,
+    and the noise of a whole batch is drawn at once
+    :param threshold: fixed threshold
+    :param eps: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: threshold_instance that get a list or array of answers to queries (in the order they are asked),
+    and returns the index of the first answer above the noisy threshold or -1 if there is no such answer.
+    after the first index is returned the instance should not be used anymore
+    """
+
+    rng = get_rng(rng)
+    noisy_threshold = threshold + rng.laplace(0, 2 / eps, 1)
+
+    def threshold_instance(answers):
+        answers = np.asarray(answers, dtype=float).reshape(-1)
+        noisy_answers = answers + rng.laplace(0, 4 / eps, len(answers))
+        above = np.flatnonzero(noisy_answers >= noisy_threshold)
+        if len(above):
+            return int(above[0])
+        else:
+            return -1
+    return threshold_instance
+
+
+def above_threshold_stream(data, queries, threshold, eps, chunk_size=2**10, rng=None):
+    """
+    above_threshold algorithm over a stream of sensitivity-1 queries
+    the queries are pulled from the stream chunk by chunk, and each chunk is tested at once
+    :param data: list or array of values
+    :param queries: iterable of queries (list, generator etc.)
+    :param threshold: fixed threshold
+    :param eps: privacy parameter
+    :param chunk_size: number of queries which are evaluated at once
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: the index of the first query whose evaluation is above the threshold or -1 if there is no such query
+    """
+
+    threshold_instance = above_threshold_batched(threshold, eps, rng)
+    asked = 0
+    for chunk in __chunks__(queries, chunk_size):
+        first_up = threshold_instance([query(data) for query in chunk])
+        if first_up != -1:
+            return asked + first_up
+        asked += len(chunk)
+    return -1
+
+
+def __choosing_mechanism__(data, solution_set, quality_function, alpha, eps, delta, beta, growth_bound,
+                           check_bound, bulk, rng):
+    """
+    the Choosing Mechanism itself. shared by choosing_mechanism and choosing_mechanism_big.
+    the quality of every element in the solution set is evaluated exactly once, and the result is used
+    for the noisy maximum, for filtering the elements with quality >= 1 and for the exponential mechanism
+    see choosing_mechanism for the parameters
+    """
+    data_size = len(data)
+    if check_bound:
+        if data_size < 16 * np.log(16 * growth_bound / alpha / beta / eps / delta) / alpha / eps:
+            raise ValueError("privacy problem - data size too small")
+    if not len(solution_set):
+        raise ValueError('domain is empty')
+    # the solution set might be given as a set
+    if not hasattr(solution_set, '__getitem__'):
+        solution_set = list(solution_set)
+    qualified_solutions = __qualify_domain__(data, solution_set, quality_function, bulk)
+    rng = get_rng(rng)
+    best_quality = np.max(qualified_solutions) + rng.laplace(0, 4 / eps, 1)
+    if best_quality < alpha * data_size / 2.0:
+        return 'bottom'
+    smaller_solution_set = np.flatnonzero(qualified_solutions >= 1)
+    index, _ = __exponential_sample__(qualified_solutions[smaller_solution_set], eps, rng)
+    return solution_set[smaller_solution_set[index]]
+
+
 def choosing_mechanism(data, solution_set, quality_function, alpha, eps,
-                       delta=0, beta=0, growth_bound=1, check_bound=True):
+                       delta=0, beta=0, growth_bound=1, check_bound=True, bulk=False, rng=None):
     """
     Choosing Mechanism for solving bounded-growth choice problems
     :param data: list or array of values
@@ -215,21 +697,17 @@ def choosing_mechanism(data, solution_set, quality_function, alpha, eps,
     :param delta: privacy parameters. only needed if check_bound=True
     :param beta: chances that the procedure will fail to return an answer. only needed if check_bound=True
     :param growth_bound: bounding parameter on the growth of the quality function. only needed if check_bound=True
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole solution set in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one element the
+    quality function get the whole solution set as input
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
     """
-    data_size = len(data)
-    if check_bound:
-        if data_size < 16 * np.log(16 * growth_bound / alpha / beta / eps / delta) / alpha / eps:
-            raise ValueError("privacy problem - data size too small")
-    best_quality = max(quality_function(data, f) for f in solution_set) + np.random.laplace(0, 4 / eps, 1)
-    if best_quality < alpha * data_size / 2.0:
-        return 'bottom'
-    smaller_solution_set = [f for f in solution_set if quality_function(data, f) >= 1]
-    return exponential_mechanism(data, smaller_solution_set, quality_function, eps)
+    return __choosing_mechanism__(data, solution_set, quality_function, alpha, eps, delta, beta, growth_bound,
+                                  check_bound, bulk, rng)
 
 
-# TODO i think those two 'big' versions should be merged into the normal ones somehow
-def exponential_mechanism_big(data, domain, quality_function, eps, bulk=False, for_sparse=False):
+def exponential_mechanism_big(data, domain, quality_function, eps, bulk=False, for_sparse=False, rng=None):
     """Exponential Mechanism that can deal with very large or very small qualities
     exponential_mechanism ( data , domain , quality function , privacy parameter )
     :param data: list or array of values
@@ -242,41 +720,16 @@ def exponential_mechanism_big(data, domain, quality_function, eps, bulk=False, f
     :param for_sparse: in cases that the domain is a very spared one, namely a big percent of the domain has quality 0,
     there is a special procedure called sparse_domain. That procedure needs, beside that result from the given
     mechanism, the total weight of the domain whose quality is more than 0. If that is the case Exponential-Mechanism
-    will return also the P DF before the normalization.
+    will return also the P DF before the normalization (as a gmpy2 mpfr number).
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
     """
-
-    # calculate a list of probabilities for each element in the domain D
-    # probability of element d in domain proportional to exp(eps*quality(data,d)/2)
-    if bulk:
-        qualified_domain = quality_function(data, domain)
-        domain_pdf = [gmpy2.exp(eps * q / 2) for q in qualified_domain]
-    else:
-        domain_pdf = [gmpy2.exp(eps * quality_function(data, d) / 2) for d in domain]
-    total_value = sum(domain_pdf)
-    domain_pdf = [d / total_value for d in domain_pdf]
-    normalizer = sum(domain_pdf)
-    # for debugging and other reasons: check that domain_cdf indeed defines a distribution
-    # use the uniform distribution (from 0 to 1) to pick an elements by the CDF
-    if abs(normalizer - 1) > 0.001:
-        raise ValueError('ERR: exponential_mechanism, sum(domain_pdf) != 1.')
-
-    # accumulate elements to get the CDF of the exponential distribution
-    domain_cdf = np.cumsum(domain_pdf).tolist()
-    # pick a uniformly random value on the CDF
-    pick = np.random.uniform()
-
-    # return the index corresponding to the pick
-    # take the min between the index and  len(D)-1 to prevent returning index out of bound
-    result = domain[min(np.searchsorted(domain_cdf, pick), len(domain)-1)]
-    # in exponential_mechanism_sparse we need also the total_sum value
-    if for_sparse:
-        return result, total_value
-    return result
+    # exponential_mechanism samples in log-space, so it already deals with very large or very small qualities
+    return exponential_mechanism(data, domain, quality_function, eps, bulk, for_sparse, rng)
 
 
 def choosing_mechanism_big(data, solution_set, quality_function, alpha, eps,
-                       delta=0, beta=0, growth_bound=1, check_bound=True):
+                       delta=0, beta=0, growth_bound=1, check_bound=True, bulk=False, rng=None):
     """
     Choosing Mechanism for solving bounded-growth choice problems
     that can deal with very large or very small qualities
@@ -289,41 +742,66 @@ def choosing_mechanism_big(data, solution_set, quality_function, alpha, eps,
     :param delta: privacy parameters. only needed if check_bound=True
     :param beta: chances that the procedure will fail to return an answer. only needed if check_bound=True
     :param growth_bound: bounding parameter on the growth of the quality function. only needed if check_bound=True
+    :param bulk: in case that we can reduce run-time by evaluating the quality of the whole solution set in bulk,
+    the procedure will be given a 'bulk' quality function. meaning that instead of one element the
+    quality function get the whole solution set as input
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
 
     """
-    data_size = len(data)
-    if check_bound:
-        if data_size < 16 * np.log(16 * growth_bound / alpha / beta / eps / delta) / alpha / eps:
-            raise ValueError("privacy problem - data size too small")
-    if not len(solution_set):
-        raise ValueError('domain is empty')
-    best_quality = max(quality_function(data, f) for f in solution_set) + np.random.laplace(0, 4 / eps, 1)
-    if best_quality < alpha * data_size / 2.0:
-        return 'bottom'
-        # return choice(solution_set)
-    smaller_solution_set = [f for f in solution_set if quality_function(data, f) >= 1]
-    return exponential_mechanism_big(data, smaller_solution_set, quality_function, eps)
+    return __choosing_mechanism__(data, solution_set, quality_function, alpha, eps, delta, beta, growth_bound,
+                                  check_bound, bulk, rng)
 
 
-def noisy_avg(vector_multi_set, predicate, dim, eps, delta):
+def noisy_avg(vector_multi_set, predicate, dim, eps, delta, rng=None):
     """
     Based on "Appendix A - Noisy average of vectors in R^d" from "Locating a Small Cluster Privately" by
      Kobbi Nissim, Uri Stemmer, and Salil Vadhan. PODS 2016.
     Given Given a multiset of vectors in R^d, obtain privately their approximate average
      with respect to soe given predicate
-    :param vector_multi_set: list of tuples
-    :param predicate: binary function from vectors in R^dim to {0,1}
+    :param vector_multi_set: array of vectors with shape (n, dim), or list of tuples
+    :param predicate: boolean mask of length n, or binary function from vectors in R^dim to {0,1}
     :param dim: the dimension of the space which the vectors are taken from
     :param eps: privacy parameter
     :param delta: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: private approximate average of the vectors with respect to soe given predicate
     """
-    delta_g = max(np.linalg.norm(v) for v in vector_multi_set if predicate(v))
-    size_of_vectrs_set = sum(1 for v in set(vector_multi_set) if predicate(v))
-    m = size_of_vectrs_set + np.random.laplace(0, 2/eps, 1) - 2*np.log(2/delta)/eps
-    if m <= 0:
-        return 'bottom'
-    sigma = 8 * delta_g * np.sqrt(2*np.log(8/delta)) / eps / m
-    r = np.random.normal(0, sigma, dim)
-    return np.sum([list(v) for v in vector_multi_set if predicate(v)], axis=0) / float(size_of_vectrs_set) + r
+    if callable(predicate):
+        mask = [bool(predicate(v)) for v in vector_multi_set]
+    else:
+        mask = predicate
+    return noisy_avgs(vector_multi_set, [mask], dim, eps, delta, rng)[0]
+
+
+def noisy_avgs(vector_multi_set, masks, dim, eps, delta, rng=None):
+    """
+    noisy_avg for many predicates over the same multiset of vectors at once
+    (e.g. one predicate per candidate cluster). norms, counts and sums are computed by numpy reductions
+    note that every average is a new execution of noisy_avg with respect to privacy
+    :param vector_multi_set: array of vectors with shape (n, dim), or list of tuples
+    :param masks: boolean array with shape (m, n). the i-th row is the predicate of the i-th average
+    :param dim: the dimension of the space which the vectors are taken from
+    :param eps: privacy parameter
+    :param delta: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
+    :return: list of m private approximate averages (or 'bottom', also for a predicate which holds for no vector)
+    """
+    vectors = np.asarray(vector_multi_set, dtype=float).reshape(-1, dim)
+    masks = np.asarray(masks, dtype=bool).reshape(-1, len(vectors))
+    sizes = masks.sum(axis=1)
+    sums = masks.dot(vectors)
+    norms = np.linalg.norm(vectors, axis=1)
+    delta_gs = np.where(masks, norms, 0).max(axis=1)
+    rng = get_rng(rng)
+    ms = sizes + rng.laplace(0, 2/eps, len(masks)) - 2*np.log(2/delta)/eps
+    averages = []
+    for size, vectors_sum, delta_g, m in zip(sizes, sums, delta_gs, ms):
+        # an empty group has no average, even if its noisy size is positive
+        if m <= 0 or size == 0:
+            averages.append('bottom')
+            continue
+        sigma = 8 * delta_g * np.sqrt(2*np.log(8/delta)) / eps / m
+        r = rng.normal(0, sigma, dim)
+        averages.append(vectors_sum / float(size) + r)
+    return averages
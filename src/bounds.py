@@ -1,11 +1,49 @@
-from math import log, sqrt, ceil, exp
+"""
+bounds on the parameters of the mechanisms
+all the bounds accept numpy arrays as well as numbers (broadcasting like numpy), so grids of parameters
+can be swept at once. solve, minimum_eps and maximum_dimension invert them
+"""
+from __future__ import division
+import numpy as np
+
+
+# numpy's ufuncs fail on python longs (e.g. a domain size of 2**64), so their arguments are converted to floats first
+def log(x):
+    return np.log(np.asarray(x, float))
+
+
+def log2(x):
+    return np.log2(np.asarray(x, float))
+
+
+def sqrt(x):
+    return np.sqrt(np.asarray(x, float))
+
+
+def ceil(x):
+    return np.ceil(np.asarray(x, float))
+
+
+def exp(x):
+    return np.exp(np.asarray(x, float))
 
 
 def log_star(x):
-    if x <= 1:
-        return 0
-    else:
-        return 1 + log_star(log(x))
+    """
+    iterated logarithm - the number of times ln should be applied on x until the result is at most 1
+    :param x: number or numpy array
+    :return: int or numpy array of ints
+    """
+    x = np.array(x, float)
+    count = np.zeros(x.shape, int)
+    above = x > 1
+    while np.any(above):
+        count += above
+        x[above] = log(x[above])
+        above = x > 1
+    if count.ndim == 0:
+        return int(count)
+    return count
 
 
 def log_n(x, n):
@@ -36,7 +74,7 @@ def step6_n2_bound(max_range, eps, alpha, beta):
     :return: the minimum samples required for step 6 to succeed
     """
 
-    r = 16 * log(log(max_range, 2) / beta) / alpha / eps
+    r = 16 * log(log2(max_range) / beta) / alpha / eps
     return 2*r
 
 
@@ -74,7 +112,7 @@ def exponential_bound(eps, alpha, beta, domain_size):
     log (1 / (delta * beta)) / eps
     :return: the minimum promise-parameter required for the exponential-mechanism to run well
     """
-    r = 16 * log(log(domain_size, 2) / beta) / alpha / eps / 3
+    r = 16 * log(log2(domain_size) / beta) / alpha / eps / 3
     return r
 
 
@@ -112,7 +150,7 @@ def san_points(eps, delta, alpha, beta):
 
 def histograms_bound(d, eps, delta):
     eps_tag = eps / sqrt(d*log(8/delta)) / 10.
-    delta_tag = delta / float(d) / 8.
+    delta_tag = delta / d / 8.
     return ceil(2 * log(2/delta_tag) / eps_tag)
 
 
@@ -125,3 +163,72 @@ def good_center_step_8_choosing_mechanism(s, d, eps, delta, alpha):
         return exp(s*(alpha - 2*m) * eps / 80. / sqrt(d*log(8/delta))) / 2.
     return bound_by_best_score(1), bound_by_best_score(0)
 
+
+def solve(bound, parameter, target, low, high, iterations=64, **parameters):
+    """
+    invert a monotone bound in one of its parameters by bisection, over arrays of parameters at once
+    the bisection is geometric (on log scale), so low and high must be positive
+    e.g. solve(dist_bound, 'eps', 1000, 1e-3, 10, delta=1e-6, alpha=0.1, beta=np.linspace(0.01, 0.1, 10))
+    :param bound: one of the bounds of this module
+    :param parameter: the name of the parameter to solve for
+    :param target: the value (or numpy array of values) of the bound to solve for
+    :param low, high: the range in which the parameter is searched
+    :param iterations: number of bisection steps
+    :param parameters: the rest of the parameters of the bound (numbers or numpy arrays)
+    :return: two numpy arrays that bracket the value of the parameter for which the bound equals target.
+    nan where the bound does not cross target in [low, high]
+    """
+    def evaluate(x):
+        parameters[parameter] = x
+        return bound(**parameters)
+
+    shape = np.broadcast(*([np.asarray(target), np.asarray(low), np.asarray(high)] +
+                           [np.asarray(v) for v in parameters.values()])).shape
+    low = low * np.ones(shape)
+    high = high * np.ones(shape)
+    low_value, high_value = evaluate(low), evaluate(high)
+    increasing = high_value >= low_value
+    crossed = (np.minimum(low_value, high_value) <= target) & (target <= np.maximum(low_value, high_value))
+    for _ in xrange(iterations):
+        middle = sqrt(low * high)
+        move_high = (evaluate(middle) > target) == increasing
+        high = np.where(move_high, middle, high)
+        low = np.where(move_high, low, middle)
+    low[~crossed] = np.nan
+    high[~crossed] = np.nan
+    return low, high
+
+
+def minimum_eps(bound, target, low=1e-6, high=1e6, **parameters):
+    """
+    the minimal privacy parameter eps for which a sample size bound is at most target
+    e.g. the minimal eps for which A_dist runs on n samples: minimum_eps(dist_bound, n, delta=..., alpha=..., beta=...)
+    :param bound: one of the bounds of this module which decrease in eps
+    :param target: the sample size (number or numpy array)
+    :param low, high: the range in which eps is searched
+    :param parameters: the rest of the parameters of the bound (numbers or numpy arrays)
+    :return: numpy array of the minimal eps (rounded up). nan where it is not in [low, high]
+    """
+    return solve(bound, 'eps', target, low, high, **parameters)[1]
+
+
+def maximum_dimension(bound, target, high=2**30, dimension_parameter='dimension', **parameters):
+    """
+    the maximal dimension for which a bound on the required amount of points is at most target
+    e.g. the maximal dimension in which good_center finds a cluster of t points:
+    maximum_dimension(good_center_points_in_cluster, t, data_size=..., eps=..., delta=..., beta=...)
+    :param bound: one of the bounds of this module which increase in the dimension
+    :param target: the amount of points (number or numpy array)
+    :param high: the maximal dimension searched
+    :param dimension_parameter: the name of the dimension parameter of the bound ('d' for histograms_bound)
+    :param parameters: the rest of the parameters of the bound (numbers or numpy arrays)
+    :return: numpy array of the maximal dimension. nan where even dimension 1 requires more than target
+    """
+    _, upper = solve(bound, dimension_parameter, target, 1, high, **parameters)
+    # the crossing point is just below upper, so the answer is floor(upper) unless upper passed an integer
+    dimension = np.floor(upper)
+    dimension = np.where(bound(**dict(parameters, **{dimension_parameter: dimension})) <= target,
+                         dimension, dimension - 1)
+    # the bound at the top of the range is at most target as well
+    top = bound(**dict(parameters, **{dimension_parameter: high})) <= target
+    return np.where(top, high, dimension)
@@ -1,10 +1,11 @@
 import good_center as gc
 import good_radius as gr
+from rng import get_rng
 from scipy.spatial.distance import euclidean
 
 
 def find(data, dimension, domain, desired_amount_of_points, approximation, failure, eps, delta,
-         shrink=False, use_histograms=False, return_ball=False):
+         shrink=False, use_histograms=False, return_ball=False, rng=None):
     # TODO the dimension parameter is redundant, can be extracted from the data's shape
     # TODO so is the domain, or maybe not?
     # TODO rename variables so that identical ones will ahave the same name in all procedures
@@ -25,13 +26,16 @@ def find(data, dimension, domain, desired_amount_of_points, approximation, failu
     instead of using the choosing-mechanism (as in the older versions of the paper)
     :param return_ball: boolean. default=False. if set to True will return, in addition to the
     radius and center, a list of the points from the data which are contained in the resulting cluster
+    :param rng: random generator. default=None (numpy's global random state). can also be an int seed
+    or a numpy RandomState/Generator
     :return: the radius and the center of the resulting cluster. if return_ball=True returns also the points which
     are contained in the cluster
     """
+    rng = get_rng(rng)
     sample_number = len(data)
-    radius = gr.find(data, domain, desired_amount_of_points, failure, eps)
+    radius = gr.find(data, domain, desired_amount_of_points, failure, eps, rng=rng)
     center = gc.find(data, sample_number, dimension, radius, desired_amount_of_points,
-                     failure, approximation, eps, delta, shrink, use_histograms)
+                     failure, approximation, eps, delta, shrink, use_histograms, rng)
     result = radius, center
     if return_ball:
         ball = [p for p in data if euclidean(p, center) <= radius]
@@ -1,6 +1,65 @@
 from math import sqrt, log, exp, factorial
 from operator import mul
-from itertools import compress
+from itertools import izip
+from collections import OrderedDict
+from functools import wraps
+import os
+import numpy as np
+
+
+def __hashable__(value):
+    """
+    convert lists, tuples and numpy arrays (recursively) into tuples so they can be used as a key of a dictionary
+    :param value: argument of a memoized function
+    :return: hashable version of the value
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(__hashable__(v) for v in value)
+    return value
+
+
+def __nbytes__(value):
+    """
+    the memory held by a memoized result
+    :param value: result of a memoized function. numpy array, tuple, or function with an 'nbytes' attribute
+    :return: number of bytes of the numpy arrays in the value
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(__nbytes__(v) for v in value)
+    return getattr(value, 'nbytes', 0)
+
+
+def __memoize__(max_size=2**10, max_bytes=2**26):
+    """
+    least-recently-used memo for the composition functions, which are called many times with the same parameters
+    the memo of a decorated function can be emptied by its 'cache' attribute
+    :param max_size: maximal number of results to keep
+    :param max_bytes: maximal memory of the kept results (see __nbytes__). larger results are not kept at all
+    :return: decorator
+    """
+    def decorator(function):
+        # key -> (value, nbytes)
+        cache = OrderedDict()
+
+        @wraps(function)
+        def memoized(*args, **kwargs):
+            key = __hashable__((args, sorted(kwargs.items())))
+            if key in cache:
+                cache[key] = cache.pop(key)
+                return cache[key][0]
+            value = function(*args, **kwargs)
+            nbytes = __nbytes__(value)
+            if nbytes <= max_bytes:
+                cache[key] = value, nbytes
+                total_bytes = sum(size for _, size in cache.itervalues())
+                while len(cache) > max_size or total_bytes > max_bytes:
+                    total_bytes -= cache.popitem(last=False)[1][1]
+            return value
+        memoized.cache = cache
+        return memoized
+    return decorator
 
 
 def nCr(n, r):
@@ -27,6 +86,122 @@ def advanced(eps, delta, delta_tag, k):
     return e_tag, k*delta+delta_tag
 
 
+def __homogeneous_deltas__(eps, k):
+    """
+    the delta_i terms of the optimal composition theorem, computed in log-space
+    delta_i = sum_{l<i} nCr(k,l)*(exp((k-l)*eps)-exp((k-2*i+l)*eps)) / (1+exp(eps))**k
+    nCr(k,l)*exp((k-l)*eps)/(1+exp(eps))**k is the binomial probability Pr[Bin(k, 1/(1+exp(eps))) = l],
+    so both parts of the sum are prefix sums of those terms (the second weighted by exp(2*l*eps))
+    :param eps: privacy parameter of each mechanism
+    :param k: number of mechanisms
+    :return: numpy array of delta_i for i = 0...k/2
+    """
+    ls = np.arange(k/2)
+    # log(nCr(k,l)) built incrementally out of log(nCr(k,l-1))
+    log_binomials = np.concatenate([[0.], np.cumsum(np.log(k - ls[1:] + 1.) - np.log(ls[1:]))])
+    log_p = -np.log1p(np.exp(-eps))
+    log_q = -eps + log_p
+    log_terms = log_binomials + (k - ls) * log_p + ls * log_q
+    log_first = np.logaddexp.accumulate(log_terms)
+    log_second = np.logaddexp.accumulate(log_terms + 2 * ls * eps)
+    # the i-th delta uses the prefix sums of l = 0...i-1
+    i = ls + 1
+    deltas = -np.exp(log_first) * np.expm1(log_second - 2 * i * eps - log_first)
+    return np.concatenate([[0.], np.clip(deltas, 0, 1)])
+
+
+@__memoize__()
+def optimal_homogeneous_curve(eps, delta, k):
+    """
+    compute the optimal combined privacy parameters of k mechanisms
+    Kairouz, Oh, Viswanath - 2015
+    :param eps: privacy parameter of each mechanism
+    :param delta: privacy parameter of each mechanism
+    :param k: number of mechanisms
+    :return: two numpy arrays (eps_i, delta_i) for i = 0...k/2. the composition is (eps_i, delta_i)-private for all i
+    the arrays are memoized, so they are read-only
+    """
+    deltas = __homogeneous_deltas__(eps, k)
+    epsilons = (k - 2 * np.arange(k/2 + 1)) * eps
+    with np.errstate(divide='ignore'):
+        # clamped at 0. so a zero delta is not returned as -0.
+        deltas = np.maximum(0., -np.expm1(np.log1p(-deltas) + k * np.log1p(-delta)))
+    epsilons.flags.writeable = False
+    deltas.flags.writeable = False
+    return epsilons, deltas
+
+
+@__memoize__()
+def optimal_homogeneous_eps(eps, delta, k, delta_g):
+    """
+    compute the minimal combined eps privacy parameter of k mechanisms by the optimal composition
+    :param eps: privacy parameter of each mechanism
+    :param delta: privacy parameter of each mechanism
+    :param k: number of mechanisms
+    :param delta_g: desired combined delta privacy parameter
+    :return: minimal eps_g such that the composition is (eps_g, delta_g)-private
+    """
+    epsilons, deltas = optimal_homogeneous_curve(eps, delta, k)
+    # the deltas increase as the epsilons decrease
+    i = np.searchsorted(deltas, delta_g, 'right') - 1
+    if i < 0:
+        raise ValueError("delta_g too small")
+    return epsilons[i]
+
+
+def build_homogeneous_table(path, eps_grid, k_grid, delta_grid):
+    """
+    precompute optimal_homogeneous_eps of pure mechanisms over a grid of parameters, and save it to a directory
+    as numpy files which are memory-mapped by load_homogeneous_table
+    :param path: directory of the table. created if needed
+    :param eps_grid: privacy parameters of each mechanism
+    :param k_grid: numbers of mechanisms
+    :param delta_grid: desired combined delta privacy parameters
+    :return: numpy array of shape (len(eps_grid), len(k_grid), len(delta_grid)) of the minimal combined eps.
+    inf where delta_g is too small
+    """
+    eps_grid, k_grid, delta_grid = np.unique(eps_grid), np.unique(k_grid).astype(int), np.unique(delta_grid)
+    table = np.empty((len(eps_grid), len(k_grid), len(delta_grid)))
+    for i, eps in enumerate(eps_grid):
+        for j, k in enumerate(k_grid):
+            epsilons, deltas = optimal_homogeneous_curve(eps, 0, k)
+            indices = np.searchsorted(deltas, delta_grid, 'right') - 1
+            table[i, j] = np.where(indices >= 0, epsilons[np.maximum(indices, 0)], np.inf)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, array in [('eps', eps_grid), ('k', k_grid), ('delta', delta_grid), ('table', table)]:
+        np.save(os.path.join(path, name + '.npy'), array)
+    return table
+
+
+def load_homogeneous_table(path):
+    """
+    memory-map a table which was saved by build_homogeneous_table
+    the parameters of a query are rounded conservatively to the grid - eps and k up and delta_g down,
+    so the answer is never smaller than the exact optimal_homogeneous_eps.
+    queries outside of the grid, and queries whose rounded delta_g is too small, are computed exactly
+    :param path: directory of the table
+    :return: function lookup(eps, delta, k, delta_g) that returns an upper bound on the minimal combined eps
+    such that the composition of k (eps,delta)-private mechanisms is (eps_g, delta_g)-private
+    """
+    eps_grid, k_grid, delta_grid, table = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                                           for name in ['eps', 'k', 'delta', 'table']]
+
+    def lookup(eps, delta, k, delta_g):
+        # the delta of the mechanisms is paid for separately: 1-delta_g = (1-pure_delta_g)*(1-delta)**k
+        pure_delta_g = -np.expm1(np.log1p(-delta_g) - k * np.log1p(-delta))
+        i = np.searchsorted(eps_grid, eps, 'left')
+        j = np.searchsorted(k_grid, k, 'left')
+        l = np.searchsorted(delta_grid, pure_delta_g, 'right') - 1
+        if i == len(eps_grid) or j == len(k_grid) or l < 0:
+            return optimal_homogeneous_eps(eps, delta, k, delta_g)
+        eps_g = table[i, j, l]
+        if np.isinf(eps_g):
+            return optimal_homogeneous_eps(eps, delta, k, delta_g)
+        return eps_g
+    return lookup
+
+
 def optimal_homogeneous(eps, delta, k):
     """
     compute the optimal combined privacy parameters of k mechanisms
@@ -34,12 +209,10 @@ def optimal_homogeneous(eps, delta, k):
     :param eps: privacy parameter of each mechanism
     :param delta: privacy parameter of each mechanism
     :param k: number of mechanisms
-    :return: privacy parameters for the composition of mechanism
+    :return: lazy list of the privacy parameters for the composition of mechanism
     """
-    for i in xrange(k/2 + 1):
-        sum_i = sum(nCr(k, l)*(exp((k-l)*eps)-exp((k-2*i+l)*eps)) for l in xrange(i))
-        delta_i = sum_i/(1-exp(eps))**k
-        yield (k-2*i)*eps, 1-(1-delta_i)*(1-delta)**k
+    for eps_i, delta_i in izip(*optimal_homogeneous_curve(eps, delta, k)):
+        yield eps_i, delta_i
 
 
 # eps is homogeneous
@@ -55,10 +228,9 @@ def __optimal_homogeneous_eps__(eps, delta, k):
     :param k:  number of mechanisms
     :return: lazy list of possible privacy parameters for k mechanisms each with (eps,delta)-privacy
     """
+    deltas = __homogeneous_deltas__(eps, k)
     for i in xrange(k/2 + 1):
-        sum_i = sum(nCr(k, l)*(exp((k-l)*eps)-exp((k-2*i+l)*eps)) for l in xrange(i))
-        delta_i = sum_i/(1-exp(eps))**k
-        yield (k-2*i)*eps, 1-(1-delta_i)*(1-delta)
+        yield (k-2*i)*eps, 1-(1-deltas[i])*(1-delta)
 
 
 def delta_bound(delta_list):
@@ -71,29 +243,71 @@ def delta_bound(delta_list):
     return 1-reduce(mul, [1-d for d in delta_list])
 
 
-def __splitter__(k):
+def __partition_sums__(eps_list):
+    """
+    compute the sums of epsilons of all the possible parts of [1...k]
+    :param eps_list: list of privacy parameters
+    :return: numpy array of size 2^k with the sum of epsilons of every part of [1...k]
+    """
+    sums = np.zeros(1)
+    for e in eps_list:
+        sums = np.concatenate([sums, sums + e])
+    return sums
+
+
+def __composition_curve__(sums, log_weights, total_eps, delta_list):
     """
-    compute all possible ways to partition [1...k] into two groups
-    :param k: maximum of the partitioned group
-    :return: lazy list of all possible ways to partition [1...k] into two groups
+    build the curve of the optimal heterogeneous composition out of the distribution of the partition sums
+    the eps side of the composition condition is
+    sum over S of Pr[S]*max(0, 1 - exp(eps_g + total_eps - 2*sum(S)))
+    and the part S contributes iff its breakpoint 2*sum(S) - total_eps is above eps_g. so the parts are sorted
+    by their breakpoints once, and every eps_g is answered by a binary search over prefix sums
+    :param sums: numpy array of partition sums
+    :param log_weights: numpy array of the log-probabilities of the partition sums
+    :param total_eps: the sum of all the epsilons
+    :param delta_list: list of delta parameter of each mechanism
+    :return: function that gets eps_g (float or numpy array) and returns the minimal delta_g
+    such that the composition is (eps_g, delta_g)-private
     """
-    l = range(1, k+1)
-    d = k
-    for i in range(2**k):
-        b = ('{0:0%db}' % d).format(i)
-        bb = [i == '1' for i in b]
-        split = set(compress(l, bb))
-        yield split, set(l)-split
+    breakpoints = 2 * sums - total_eps
+    order = np.argsort(-breakpoints)
+    negative_breakpoints = -breakpoints[order]
+    weights = np.concatenate([[0.], np.cumsum(np.exp(log_weights[order]))])
+    discounted_weights = np.concatenate([[0.], np.cumsum(np.exp(log_weights[order] + negative_breakpoints))])
+    pure_side = 1 - delta_bound(delta_list)
+
+    def curve(eps_g):
+        contributing = np.searchsorted(negative_breakpoints, -np.asarray(eps_g, float), 'left')
+        eps_side = weights[contributing] - np.exp(eps_g) * discounted_weights[contributing]
+        return 1 - (1 - np.clip(eps_side, 0, 1)) * pure_side
+    # so the memo knows how much memory the curve holds
+    curve.nbytes = negative_breakpoints.nbytes + weights.nbytes + discounted_weights.nbytes
+    return curve
 
 
-def __sum_part_of_eps_list__(eps_list, part_of_k):
+@__memoize__()
+def heterogeneous_curve(eps_list, delta_list, precision=None):
     """
-    sum epsilons from a given part of the list [1...k]
-    :param eps_list:
-    :param part_of_k: part of the list [1...k]
-    :return: sum of epsilons from the list if they are included in part_of_k
+    compute the optimal combined privacy parameters of k mechanisms
+    each with different privacy parameters, for all the possible combined eps at once
+    Murtagh, Vadhan - 2015
+    :param eps_list, delta_list: lists of privacy parameters
+    :param precision: None for the exact curve, which enumerates all 2^k partitions of [1...k].
+    float > 0 for the approximation of approximate_heterogeneous (an upper bound on the exact curve)
+    :return: monotone decreasing function that gets eps_g (float or numpy array) and returns the minimal delta_g
+    such that the composition is (eps_g, delta_g)-private
     """
-    return sum(eps_list[i-1] for i in part_of_k)
+    if precision is None:
+        sums = __partition_sums__(eps_list)
+        total_eps = sum(eps_list)
+        # Pr[S] = exp(sum(S)) / prod(1+exp(eps_i))
+        log_weights = sums - np.logaddexp(0, np.asarray(eps_list, float)).sum()
+    else:
+        probabilities, total_eps = __heterogeneous_distribution__(eps_list, precision)
+        sums = np.arange(len(probabilities)) * precision
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(probabilities)
+    return __composition_curve__(sums, log_weights, total_eps, delta_list)
 
 
 def optimal_heterogeneous(eps_list, delta_list, eps_g, delta_g):
@@ -106,34 +320,82 @@ def optimal_heterogeneous(eps_list, delta_list, eps_g, delta_g):
     :param delta_g: desired combined eps privacy parameter
     :return: check if (eg,dg) are indeed legitimate privacy parameters of the composition
     """
-    k = len(eps_list)
-    sum_eg = sum([max(0,
-                      exp(__sum_part_of_eps_list__(eps_list, split[0]))
-                      - exp(eps_g)*exp(__sum_part_of_eps_list__(eps_list, split[1])))
-                  for split in __splitter__(k)])
-    eps_side = 1 / reduce(mul, [1 + exp(e) for e in eps_list])
-    delta_side = 1 - (1-delta_g)/(reduce(mul, [1-d for d in delta_list]))
-    return eps_side*sum_eg <= delta_side
+    return heterogeneous_curve(eps_list, delta_list)(eps_g) <= delta_g
+
+
+def __heterogeneous_distribution__(eps_list, precision):
+    """
+    distribution of the sum of epsilons over a random part of [1...k]
+    in which every i is included independently with probability exp(eps_i)/(1+exp(eps_i))
+    each epsilon is rounded up to a multiple of precision, so the sums are on a grid of size sum(eps_list)/precision
+    :param eps_list: list of privacy parameters
+    :param precision: float > 0. grid size of the rounded epsilons
+    :return: numpy array whose m-th element is the probability that the rounded sum is m*precision,
+    and the sum of all the rounded epsilons
+    """
+    units = np.ceil(np.asarray(eps_list, float) / precision).astype(int)
+    total_units = units.sum()
+    probabilities = np.zeros(total_units + 1)
+    probabilities[0] = 1
+    for u in units:
+        p = 1 / (1 + np.exp(-u * precision))
+        included = p * probabilities[:total_units + 1 - u]
+        probabilities *= 1 - p
+        probabilities[u:] += included
+    return probabilities, total_units * precision
+
+
+def approximate_heterogeneous(eps_list, delta_list, eps_g, delta_g, precision=1e-3):
+    """
+    compute the optimal combined privacy parameters of k mechanisms
+    each with different privacy parameters, approximately and in polynomial time
+    the epsilons are rounded up to multiples of precision and the partitions are counted by dynamic programming
+    over the rounded sums (in the spirit of Murtagh, Vadhan - 2015). rounding up only makes the mechanisms less
+    private, so a positive answer holds for the original parameters as well
+    running time O(k*sum(eps_list)/precision)
+    :param eps_list, delta_list: lists of privacy parameters
+    :param eps_g: desired combined eps privacy parameter
+    :param delta_g: desired combined delta privacy parameter
+    :param precision: float > 0. the accuracy of the approximation. smaller is tighter but slower
+    :return: check if (eg,dg) are certainly legitimate privacy parameters of the composition
+    """
+    return approximate_heterogeneous_delta(eps_list, delta_list, eps_g, precision) <= delta_g
+
+
+def approximate_heterogeneous_delta(eps_list, delta_list, eps_g, precision=1e-3):
+    """
+    compute an upper bound on the minimal delta_g such that the composition of k mechanisms
+    each with different privacy parameters is (eps_g, delta_g)-private. see approximate_heterogeneous
+    :param eps_list, delta_list: lists of privacy parameters
+    :param eps_g: desired combined eps privacy parameter
+    :param precision: float > 0. the accuracy of the approximation. smaller is tighter but slower
+    :return: upper bound on the combined delta privacy parameter
+    """
+    return heterogeneous_curve(eps_list, delta_list, precision)(eps_g)
 
 
-def find_eg(eps_list, delta_list, fixed_new_delta, t):
+@__memoize__()
+def find_eg(eps_list, delta_list, fixed_new_delta, t, precision=None):
     """
     use binary search to find eps_g as in the optimal_heterogeneous method
+    the curve of the composition is computed once, so every step of the search is a O(log) lookup
     :param es, delta_list: lists of privacy parameters
     :param fixed_new_delta: desired combined eps privacy parameter
     :param t: binary search steps limit
+    :param precision: None for the exact composition. float > 0 for the approximation of approximate_heterogeneous
     :return: minimal eps_g such (eps_eg, delta_eg) are indeed legitimate privacy parameters of the composition
     """
-    k = len(eps_list), len(eps_list)
-    i, eg, r_g = sum(eps_list), sum(eps_list), sum(eps_list)
+    curve = heterogeneous_curve(eps_list, delta_list, precision)
+    total_eps = sum(eps_list)
+    i, eg, r_g = total_eps, total_eps, total_eps
     while t > 0:
         i /= 2.0
         # print t, i , eg
-        a = (-1)**optimal_heterogeneous(eps_list, delta_list, eg, fixed_new_delta)
+        a = -1 if curve(eg) <= fixed_new_delta else 1
         if a == -1:
             r_g = eg
         eg += a*i
-        if eg > k:
+        if eg > total_eps:
             raise ValueError("delta_g too small")
         t -= 1
     return r_g
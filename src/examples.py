@@ -7,6 +7,7 @@ helper module containing:
 """
 import numpy as np
 from collections import deque
+from qualities import __sorted__
 
 
 def point_concept(p):
@@ -115,27 +116,20 @@ def databases_distance(data_1, data_2):
 
 
 def __build_intervals_set__(data_base, interval_length, range_start, range_max, shift=False):
+    """
+    the intervals of a partition of the range which contain data points
+    :param data_base: list or numpy array of numbers, or a SortedDataIndex
+    :param interval_length: length of the intervals of the partition
+    :param range_start, range_max: only data points in [range_start, range_max] are considered
+    :param shift: if True the partition is shifted by half an interval
+    :return: sorted list of the starts of the intervals which contain data points
+    """
     # TODO maybe move this method outside of the module
-    # TODO remove non-negative assumption dependence
-    # assuming all the data is non-negative
-    data_que = deque(sorted(data_base))
-    list_of_intervals = []
-    # data_next = -1
-    data_next = data_que.popleft()
-
-    while data_next < range_start:
-        data_next = data_que.popleft()
-
-    while len(data_que) > 0 and data_next <= range_max:
-        next_relevant_interval_start = (int(data_next - shift * interval_length/2) / interval_length) \
-                                       * interval_length + shift*interval_length/2
-        # TODO remove redundant variable
-        next_relevant_interval = next_relevant_interval_start
-        list_of_intervals.append(next_relevant_interval)
-        while data_next < next_relevant_interval + interval_length and len(data_que) > 0:
-            data_next = data_que.popleft()
-
-    return list_of_intervals
+    points = __sorted__(data_base)
+    points = points[np.searchsorted(points, range_start, 'left'):np.searchsorted(points, range_max, 'right')]
+    offset = shift * interval_length / 2
+    starts = np.trunc(points - offset).astype(int) // interval_length * interval_length + offset
+    return np.unique(starts).tolist()
 
 
 def __old_build_intervals_set__(data_base, interval_length, range_start, range_max, shift=False):
@@ -2,11 +2,12 @@ import basicdp
 import math
 from examples import __build_intervals_set__
 from functools import partial
+from rng import get_rng
 
 
 # TODO check endpoints of interval along the code
 def evaluate(data, range_max_value, quality_function, quality_promise, approximation, eps, delta,
-             intervals_bounding, max_in_interval, use_exponential=True):
+             intervals_bounding, max_in_interval, use_exponential=True, rng=None):
     """
     RecConcave algorithm for the specific case of N=2
     :param data: the main data-set
@@ -21,9 +22,11 @@ def evaluate(data, range_max_value, quality_function, quality_promise, approxima
     for j in the interval
     :param use_exponential: the original version uses A_dist mechanism. for utility reasons the exponential-mechanism
     is the default. turn to False to use A_dist instead
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: an element of domain with approximately maximum value of quality function
     """
 
+    rng = get_rng(rng)
     # step 2
     # print "step 2"
     log_of_range = int(math.ceil(math.log(range_max_value, 2)))
@@ -38,13 +41,22 @@ def evaluate(data, range_max_value, quality_function, quality_promise, approxima
     # step 4
     # print "step 4"
 
+    # every L(j) is used by the qualities of both j and j-1, so it is computed only once
+    bounds = {}
+
+    def bounding(data_base, j):
+        if j not in bounds:
+            bounds[j] = intervals_bounding(data_base, range_max_value_tag, j)
+        return bounds[j]
+
     def recursive_quality_function(data_base, j):
-        return min(intervals_bounding(data_base, range_max_value_tag, j) - (1 - approximation) * quality_promise,
-                   quality_promise-intervals_bounding(data_base, range_max_value_tag, j + 1))
+        return min(bounding(data_base, j) - (1 - approximation) * quality_promise,
+                   quality_promise-bounding(data_base, j + 1))
 
     # step 6
     # print "step 6"
-    recursion_returned = basicdp.exponential_mechanism_big(data, range(log_of_range+1), recursive_quality_function, eps)
+    recursion_returned = basicdp.exponential_mechanism_big(data, range(log_of_range+1), recursive_quality_function, eps,
+                                                           rng=rng)
 
     good_interval = 8 * (2 ** recursion_returned)
     # print "good interval: %d" % good_interval
@@ -64,13 +76,13 @@ def evaluate(data, range_max_value, quality_function, quality_promise, approxima
         second_full_domain = xrange(good_interval / 2, range_max_value, good_interval)
         first_chosen_interval = basicdp.sparse_domain(basicdp.exponential_mechanism_big, data,
                                                       first_full_domain, first_intervals,
-                                                      max_quality, eps)
+                                                      max_quality, eps, rng=rng)
         second_chosen_interval = basicdp.sparse_domain(basicdp.exponential_mechanism_big, data,
                                                        second_full_domain, second_intervals,
-                                                       max_quality, eps)
+                                                       max_quality, eps, rng=rng)
     else:
-        first_chosen_interval = basicdp.a_dist(data, first_intervals, max_quality, eps, delta)
-        second_chosen_interval = basicdp.a_dist(data, second_intervals, max_quality, eps, delta)
+        first_chosen_interval = basicdp.a_dist(data, first_intervals, max_quality, eps, delta, rng=rng)
+        second_chosen_interval = basicdp.a_dist(data, second_intervals, max_quality, eps, delta, rng=rng)
 
     if type(first_chosen_interval) == str and type(second_chosen_interval) == str:
         raise ValueError("stability problem, try taking more samples!")
@@ -87,5 +99,5 @@ def evaluate(data, range_max_value, quality_function, quality_promise, approxima
         second_chosen_interval_as_list = range(second_chosen_interval, second_chosen_interval + good_interval)
 
     return basicdp.exponential_mechanism_big(data, first_chosen_interval_as_list + second_chosen_interval_as_list,
-                                         extended_quality_function, eps)
+                                         extended_quality_function, eps, rng=rng)
 
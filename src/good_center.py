@@ -1,11 +1,9 @@
 import numpy as np
-from basicdp import choosing_mechanism_big, above_threshold, noisy_avg
+from basicdp import choosing_mechanism_big, above_threshold_batched, noisy_avg
 from collections import Counter
 from jl import johnson_lindenstrauss_transform_init as jl_init
 from functools import partial
-from scipy.spatial import distance
-from numpy.random import laplace
-from random import choice
+from rng import get_rng
 from numpy.linalg import norm
 
 
@@ -27,6 +25,23 @@ def __box_containing_point__(point, partition, dimension, side_length):
         return np.floor((point-partition) / side_length)
 
 
+def __max_points_in_box__(points, partition, side_length):
+    """
+    the quality of a boxes partitioning of the space
+    :param points: array of points in R^dimension (one point per row)
+    :param partition: the partition's shift, the i-th value represents the shift in the i-th axis
+    :param side_length: the size of the boxes' side
+    :return: the maximum number of points in a single box of the partition
+    """
+    # adding 0. turns -0. into 0. so both are considered the same box
+    boxes = np.floor((np.asarray(points) - partition) / side_length) + 0.
+    boxes = np.ascontiguousarray(boxes.reshape(len(boxes), -1))
+    # view every box (row) as a single item so the boxes can be counted by np.unique
+    rows = boxes.view(np.dtype((np.void, boxes.dtype.itemsize * boxes.shape[1])))
+    _, counts = np.unique(rows, return_counts=True)
+    return counts.max()
+
+
 def __interval_containing_point__(point, side_length):
     """
     finds the interval containing a given value
@@ -37,7 +52,7 @@ def __interval_containing_point__(point, side_length):
     return np.floor(point / side_length)
 
 
-def histograms(data, dimension, shift, side, eps, delta):
+def histograms(data, dimension, shift, side, eps, delta, rng=None):
     """
     Based on Theorem 2.5 from "Locating a Small Cluster Privately"
     by Kobbi Nissim, Uri Stemmer, and Salil Vadhan. PODS 2016.
@@ -50,8 +65,10 @@ def histograms(data, dimension, shift, side, eps, delta):
     :param side: the side-length of each 'box' in the partition
     :param eps: privacy parameter
     :param delta: privacy parameter
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: parts of the partition that contain a lot of data-points
     """
+    rng = get_rng(rng)
     my_box = partial(__box_containing_point__, partition=shift, dimension=dimension, side_length=side)
     # those are the parts of the partition that have at least one point
     #  when each box appears as many times as the numbers of points in it
@@ -59,7 +76,7 @@ def histograms(data, dimension, shift, side, eps, delta):
     boxes_quality = Counter(boxes)
     non_zero = False
     for b in boxes_quality:
-        boxes_quality[b] += laplace(0, 2/eps, 1)[0]
+        boxes_quality[b] += rng.laplace(0, 2/eps, 1)[0]
         if boxes_quality[b] < 2*np.log(2/delta)/eps:
             boxes_quality[b] = 0
         # the current boxes_quality won't be '0' so the process can return an answer
@@ -71,7 +88,7 @@ def histograms(data, dimension, shift, side, eps, delta):
 
 
 def find(data, number_of_points, data_dimension, radius, points_in_ball,
-         failure, approximation, eps, delta, shrink=False, use_histograms=False):
+         failure, approximation, eps, delta, shrink=False, use_histograms=False, rng=None):
     # TODO number_of_points is redundant
     """
     Given a data set, desired number of points and a radius finds the center a cluster with approximately
@@ -89,8 +106,11 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
     obtain a better answer (not relevant in dimension < 600)
     :param use_histograms: boolean. default=False. if set to True will use Theorem 2.5 from the paper
     instead of using the choosing-mechanism (as in the older versions of the paper)
+    :param rng: random generator. default=None (numpy's global random state). can also be an int seed
+    or a numpy RandomState/Generator
     :return: the center a cluster with approximately that number of points and approximately that radius
     """
+    rng = get_rng(rng)
     # step 1
     # print "step 1"
     if shrink:
@@ -102,14 +122,14 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
     # step 2
     # print "step 2"
     if shrink:
-        transform = jl_init(data_dimension, new_dimension)
+        transform = jl_init(data_dimension, new_dimension, rng)
         projected_data = transform(data)
     else:
         def transform(x): return x
         projected_data = data
     threshold = points_in_ball - 100 * np.log2(2 * number_of_points / failure) / eps
     # print "the threshold is: %f" % threshold
-    above_thresh = above_threshold(projected_data, threshold, eps/4.0)
+    above_thresh = above_threshold_batched(threshold, eps/4.0, rng)
 
     # step 3
     # print "step 3"
@@ -118,22 +138,20 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
     tries = 2 * number_of_points * int(np.log2(1 / failure)) / failure
     # print "maximum no. of tries: %d" % tries
     while not found_max and tries > 0:
-        boxes_shift = np.random.uniform(0, box_side_length, new_dimension)
-
-        # step 5
-        # print "step 5"
-
-        def partition_quality(data_base):
+        # the random shifts are drawn in small batches, but qualified and tested one by one,
+        # so no shift is qualified after the first one above the threshold
+        shifts = rng.uniform(0, box_side_length, (int(min(8, np.ceil(tries))), new_dimension))
+        for shift in shifts:
+            # step 5
+            # print "step 5"
             # TODO seems like I am ignoring 0-quality elements. Need fix?
-            boxes = (__box_containing_point__(p, boxes_shift, new_dimension, box_side_length) for p in data_base)
-            c = Counter(boxes)
-            return c[max(c, key=c.get)]
-
-        # print "maximum number of points in a single box: %d" % partition_quality(projected_data)
-        find_best_box = above_thresh(partition_quality)
-        if find_best_box == 'up':
-            found_max = True
-        else:  # find_best_box == 'bottom'
+            partition_quality = __max_points_in_box__(projected_data, shift, box_side_length)
+
+            # print "maximum number of points in a single box: %d" % partition_quality
+            if above_thresh([partition_quality]) != -1:
+                boxes_shift = shift
+                found_max = True
+                break
             tries -= 1
 
     # step 6
@@ -155,9 +173,10 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
     boxes_set = list(set(box_containing_point_our_case(p) for p in projected_data))
 
     if use_histograms:
-        best_box = histograms(projected_data, new_dimension, boxes_shift, box_side_length, eps / 4., delta / 4.)
+        best_box = histograms(projected_data, new_dimension, boxes_shift, box_side_length, eps / 4., delta / 4., rng)
     else:
-        best_box = choosing_mechanism_big(projected_data, boxes_set, box_quality, 1, approximation, failure, eps/4.0, delta/4.0)
+        best_box = choosing_mechanism_big(projected_data, boxes_set, box_quality, 1, approximation, failure, eps/4.0, delta/4.0,
+                                          rng=rng)
         if type(best_box) == str:
             raise ValueError("choosing mechanism returned 'bottom'")
 
@@ -176,7 +195,7 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
         eps_tag = eps / np.sqrt(data_dimension * np.log(8/delta)) / 10.0
         delta_tag = delta / data_dimension / 8.0
         if use_histograms:
-            best_interval = histograms(projection_on_axis, 1, 0, interval_length, eps_tag, delta_tag)
+            best_interval = histograms(projection_on_axis, 1, 0, interval_length, eps_tag, delta_tag, rng)
             extended_interval = ((best_interval - 1) * interval_length, (best_interval + 2) * interval_length)
             center_box.append(extended_interval)
         else:
@@ -190,7 +209,7 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
             # TODO what is the failure and approximation parameter?
             # TODO should I use the 'sparse' version?
             best_interval = choosing_mechanism_big(projected_data, axis_projection, interval_quality,
-                                                   1, approximation, failure, eps_tag, delta_tag)
+                                                   1, approximation, failure, eps_tag, delta_tag, rng=rng)
             try:
                 extended_interval = ((best_interval-1) * interval_length, (best_interval+2) * interval_length)
                 center_box.append(extended_interval)
@@ -199,13 +218,14 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
 
     # print "step 9"
     center_of_chosen_box = [(i[1]-i[0])/2. for i in center_box]
+    data_points = np.asarray(data).reshape(len(data), -1)
     try:
-        chosen_ball = [tuple(p) for p in data if distance.euclidean(center_of_chosen_box, p) <= interval_length*3]
+        in_chosen_ball = norm(data_points - center_of_chosen_box, axis=1) <= interval_length*3
     # TODO when does this error rise?
     except ValueError:
         raise ValueError("something wrong! the center found is %s" % (str(center_of_chosen_box)))
 
-    if not chosen_ball:
+    if not in_chosen_ball.any():
         print "chosen ball is empty!"
         return center_of_chosen_box
         # TODO when done - change the return to the error
@@ -213,11 +233,7 @@ def find(data, number_of_points, data_dimension, radius, points_in_ball,
 
     # step 10
     # print "step 10"
-    def predictor(x):
-        return x in chosen_ball
-
     # TODO delete (was in use in the past)
     # delta_g = max(norm(v) for v in chosen_ball)
     # best_box, box_quality(data, best_box), center_box, chosen_ball
-    return noisy_avg(chosen_ball, predictor, data_dimension, eps/4., delta/4.)
-
+    return noisy_avg(data_points, in_chosen_ball, data_dimension, eps/4., delta/4., rng)
@@ -3,7 +3,7 @@ from numpy import sum, log, sqrt, ceil, arange
 import numpy as np
 from basicdp import exponential_mechanism_big
 from sklearn.metrics.pairwise import euclidean_distances as distances
-from numpy.random import laplace
+from rng import get_rng
 
 
 def __max_average_ball__(radius, hood, t):
@@ -53,7 +53,7 @@ def __sparse_domain__(domain, dimension):
     return new_domain
 
 
-def find(data, domain, goal_number, failure, eps, sparse=True):
+def find(data, domain, goal_number, failure, eps, sparse=True, rng=None):
     """
     Based on "Locating a Small Cluster Privately" by Kobbi Nissim, Uri Stemmer, and Salil Vadhan. PODS 2016.
     Given a data set, finds the radius of an approximately minimal cluster of points with
@@ -64,8 +64,11 @@ def find(data, domain, goal_number, failure, eps, sparse=True):
     :param failure: 0 < float < 1. chances that the procedure will fail to return an answer
     :param eps: float > 0. privacy parameter
     :param sparse: 1 > float > 0. privacy parameter
+    :param rng: random generator. default=None (numpy's global random state). can also be an int seed
+    or a numpy RandomState/Generator
     :return: the radius of the resulting cluster
     """
+    rng = get_rng(rng)
     # max(abs(np.min(data)), np.max(data))
     all_distances = distances(data)
     # TODO change variable name
@@ -73,7 +76,7 @@ def find(data, domain, goal_number, failure, eps, sparse=True):
     a = 2 * log(domain[0] / failure) / eps
     thresh = goal_number - a - log(1 / failure) / eps
     # TODO verify that the noise addition is correct
-    if __max_average_ball__(0, all_distances, goal_number) + laplace(0, 1 / eps, 1) > thresh:
+    if __max_average_ball__(0, all_distances, goal_number) + rng.laplace(0, 1 / eps, 1) > thresh:
         return 0
 
     dimension = data.shape[1]
@@ -87,5 +90,5 @@ def find(data, domain, goal_number, failure, eps, sparse=True):
         return min(goal_number - __max_average_ball__(r / 2, all_distances, goal_number),
                    __max_average_ball__(r, all_distances, goal_number) - goal_number + 2*a) / 2
 
-    return exponential_mechanism_big(data, new_domain, quality, eps / 2)
+    return exponential_mechanism_big(data, new_domain, quality, eps / 2, rng=rng)
 
@@ -4,7 +4,7 @@
 from __future__ import division
 from numpy import zeros, sum, sqrt, log, log2, arange, ceil
 import numpy as np
-from numpy.random import laplace
+from rng import get_rng
 from bounds import log_star
 from basicdp import exponential_mechanism
 from scipy.spatial.distance import euclidean
@@ -43,7 +43,7 @@ def __promise__(data, domain, eps, delta, failure):
 
 
 # the parameter promise should later be removed from the input and be calculated within the function
-def find(data, goal_number, failure, eps, delta, promise=-1):
+def find(data, goal_number, failure, eps, delta, promise=-1, rng=None):
     # TODO docstring
     """
 
@@ -53,13 +53,15 @@ def find(data, goal_number, failure, eps, delta, promise=-1):
     :param eps:
     :param delta:
     :param promise:
+    :param rng:
     :return:
     """
+    rng = get_rng(rng)
     domain = abs(max(np.max(data, axis=0)) - min(np.min(data, axis=0)))
     if promise == -1:
         promise = __promise__(data, domain, eps, delta, failure)
     all_distances = distances(data)
-    if __max_average_ball__(0, all_distances, goal_number) + laplace(0, 4/eps, 1) >\
+    if __max_average_ball__(0, all_distances, goal_number) + rng.laplace(0, 4/eps, 1) >\
                             goal_number - 2*promise - 4/eps*log(2/failure):
         return 0
 
@@ -83,5 +85,5 @@ def find(data, goal_number, failure, eps, delta, promise=-1):
 
     return evaluate(data, domain, quality, promise,
                     0.5, eps, delta,
-                    radius_interval_bounding, max_radius_in_interval)
+                    radius_interval_bounding, max_radius_in_interval, rng=rng)
 
@@ -1,4 +1,5 @@
 import numpy as np
+from rng import get_rng
 from sklearn.random_projection import johnson_lindenstrauss_min_dim
 
 
@@ -24,31 +25,33 @@ def __test_transform__(samples, orig_dim, new_dim, diff, iters):
     return success/float(iters)
 
 
-def johnson_lindenstrauss_transform_init(original_dimension, target_dimension):
+def johnson_lindenstrauss_transform_init(original_dimension, target_dimension, rng=None):
     """
     Johnson Lindenstrauss transform
     low-distortion embeddings of points from high-dimensional into low-dimensional Euclidean space
     :param original_dimension: the dimension from which the points where taken
     :param target_dimension: the target dimension
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: instance of jl transform
     that gets set of points in R^d space when d = original_dimension as an numpy array
     and returns a projected set in R^k space when k = target_dimension as numpy array
     """
-    normal_matrix = np.random.normal(0, 1, original_dimension*target_dimension)
+    normal_matrix = get_rng(rng).normal(0, 1, original_dimension*target_dimension)
     normal_matrix = normal_matrix.reshape(target_dimension, original_dimension)
     return lambda points: np.array([np.dot(normal_matrix, p.transpose())/np.sqrt(target_dimension) for p in points])
 
 
-def johnson_lindenstrauss_transform(points, original_dimension, target_dimension):
+def johnson_lindenstrauss_transform(points, original_dimension, target_dimension, rng=None):
     """
     Johnson Lindenstrauss transform
     low-distortion embeddings of points from high-dimensional into low-dimensional Euclidean space
     :param points: set of point in R^d space when d = original_dimension : numpy array
     :param original_dimension: the dimension from which the points where taken
     :param target_dimension: the target dimension
+    :param rng: random generator. None (numpy's global random state), int seed, or a numpy RandomState/Generator
     :return: projected set of points in R^k space when k = target_dimension : numpy array
     """
-    normal_matrix = np.random.normal(0, 1, original_dimension*target_dimension)
+    normal_matrix = get_rng(rng).normal(0, 1, original_dimension*target_dimension)
     normal_matrix = normal_matrix.reshape(target_dimension, original_dimension)
     return np.array([np.dot(normal_matrix, p.transpose())/np.sqrt(target_dimension) for p in points])
 
@@ -11,6 +11,63 @@ def iterlen(it):
     return sum(1 for _ in it)
 
 
+class SortedDataIndex(object):
+    """
+    immutable index of a data set - the data sorted once, for rank, interval count and window queries in O(log(n))
+    can be passed instead of the data to the quality functions of this module (and to the mechanisms which pass the
+    data to them). iterating over it gives the data points in sorted order
+    """
+
+    def __init__(self, data):
+        """
+        :param data: list or numpy array of numbers, or another SortedDataIndex
+        """
+        self.points = __sorted__(data)
+        self.points.flags.writeable = False
+        self.__window_bounding__ = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def rank(self, x, side='left'):
+        """
+        :param x: number or numpy array of numbers
+        :param side: 'left' to count the points smaller than x, 'right' to count the points smaller or equal to x
+        :return: the number of points below x
+        """
+        return np.searchsorted(self.points, x, side)
+
+    def count(self, start, end):
+        """
+        :param start, end: the interval (both inclusive). numbers or numpy arrays
+        :return: the number of points in the interval (0 for an interval that ends before it starts)
+        """
+        return np.maximum(self.rank(end, 'right') - self.rank(start, 'left'), 0)
+
+    def max_window(self, interval, j):
+        """
+        :param interval: (start, end) both inclusive
+        :param j: window size exponent. -1 for an empty window
+        :return: the maximum number of points in any window of length 2^j inside the interval
+        """
+        if self.__window_bounding__ is None:
+            self.__window_bounding__ = point_count_table(self.points, -1)
+        return self.__window_bounding__(interval, j)
+
+
+def __sorted__(data):
+    """
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :return: numpy array of the data points sorted (not copied for a SortedDataIndex)
+    """
+    if isinstance(data, SortedDataIndex):
+        return data.points
+    return np.sort(np.asarray(data))
+
+
 def quality_median(data, range_element):
     """
     sensitivity-1 quality function
@@ -23,30 +80,40 @@ def quality_median(data, range_element):
     return -max(0, len(data) / 2 - min(greater_than, less_than))
 
 
+def __as_array__(domain):
+    """
+    convert a domain into a numpy array
+    :param domain: list, xrange or numpy array
+    :return: numpy array of the domain elements
+    """
+    if isinstance(domain, xrange) and len(domain) > 1:
+        # building an array out of xrange element by element is much slower than arange
+        step = domain[1] - domain[0]
+        return np.arange(domain[0], domain[-1] + step, step)
+    return np.asarray(domain)
+
+
+def __count_below__(data, domain):
+    """
+    count for every domain element the data points which are smaller than it
+    the data is sorted once and the domain is binary-searched in it - O((n+|D|)log(n))
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param domain: list, xrange or numpy array of numbers
+    :return: numpy array of the counts, in the order of the domain
+    """
+    return np.searchsorted(__sorted__(data), __as_array__(domain), 'left')
+
+
 def bulk_quality_median(data, domain):
     """
     sensitivity-1 bulk quality function
     used to find the median fo the data
     quality_median( data , domain )
-    :return: list of "distances" of every domain elements from the median of the data
-    """
-    greater_than = len(data)
-    less_than = 0
-    domain_que = deque(sorted(data))
-    qualities = []
-    data_next = min(domain)-1
-    while len(domain_que) > 0:
-        data_prev = data_next
-        data_next = domain_que.popleft()
-        qualities.append([-max(0, len(data) / 2 - min(greater_than, less_than))
-                          for i in domain if data_prev < i <= data_next])
-        greater_than -= 1
-        less_than += 1
-    qualities.append([-max(0, len(data) / 2 - min(greater_than, less_than))
-                      for i in domain if data_next < i])
-    # qualities is a list of lists of qualities so:
-    # return flatted qualities list
-    return [item for sub_list in qualities for item in sub_list]
+    :return: numpy array of "distances" of every domain elements from the median of the data
+    """
+    less_than = __count_below__(data, domain)
+    greater_than = len(data) - less_than
+    return -np.maximum(0, len(data) / 2 - np.minimum(greater_than, less_than))
 
 
 # for rec_concave testing
@@ -69,53 +136,79 @@ def bulk_quality_minmax(data, domain):
     sensitivity-1 bulk quality function
     used to find a minmax or median for the data
     bulk_quality_minmax( data , domain )
-    :return: the minimum between the amount of data above the element and the data below
+    :return: numpy array of the minimum between the amount of data above every domain element and the data below
     """
-    greater_than = len(data)
-    less_than = 0
-    domain_que = deque(sorted(data))
-    qualities = []
-    data_next = min(domain) - 1
-    while len(domain_que) > 0:
-        data_prev = data_next
-        data_next = domain_que.popleft()
-        qualities.append([min(greater_than, less_than)
-                          for i in domain if data_prev < i <= data_next])
-        greater_than -= 1
-        less_than += 1
-    qualities.append([min(greater_than, less_than)
-                      for i in domain if data_next < i])
-    # qualities is a list of lists of qualities so:
-    # return flatted qualities list
-    return [item for sub_list in qualities for item in sub_list]
+    less_than = __count_below__(data, domain)
+    return np.minimum(len(data) - less_than, less_than)
 
 
-def min_max_intervals_bounding(data, max_range, j):
-    if j == 0:
-        return min_max_maximum_quality(data, 0, max_range)
+def rank_segments(data, range_max_value):
+    """
+    split the integers [0, range_max_value] into segments in which the amount of data below every element is the same.
+    the qualities which depend only on it (like bulk_quality_median and bulk_quality_minmax) are constant on every
+    segment, so the mechanisms can work on the O(n) segments instead of the whole range
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param range_max_value: maximum possible output (the minimum output is 0). smaller than 2^63
+    :return: two numpy arrays of integers - the starts of the segments and their lengths
+    """
+    points = __sorted__(data)
+    # an integer i is above x iff i >= floor(x) + 1
+    if np.issubdtype(points.dtype, np.integer):
+        changes = points.astype(np.int64) + 1
+    else:
+        changes = np.floor(points).astype(np.int64) + 1
+    changes = changes[(changes > 0) & (changes <= range_max_value)]
+    starts = np.union1d(np.zeros(1, np.int64), changes)
+    lengths = np.diff(np.append(starts, np.int64(range_max_value) + 1))
+    return starts, lengths
 
-    ceil_data = set(np.ceil(x) for x in data)
-    floor_data = set(np.floor(x) for x in data)
-    rounded_data = floor_data.union(ceil_data)
-    points_of_interest = [x for x in rounded_data if x >= 2**j - 1 or x <= max_range - 2**j + 1]
-    before = set(y - 2**j + 1 for y in points_of_interest if y >= 2**j - 1)
-    after = set(y + 2**j - 1 for y in points_of_interest if y <= max_range - 2**j + 1)
 
-    points_to_qualify = sorted(list(set(points_of_interest).union(before, after)))
-    if len(points_to_qualify) == 0:
-        return 0
-    else:
-        interest_qualities = bulk_quality_minmax(data, points_to_qualify)
+def __min_max_bounding__(data, max_range, exponents):
+    """
+    L(j) of the minmax quality for several j at once
+    the quality of an interval of length 2^j is the minimum of the minmax qualities of its two ends,
+    and it is enough to check the intervals which start or end at a (rounded) data point
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param max_range: maximum possible output (the minimum output is 0)
+    :param exponents: numpy array of j's
+    :return: numpy array of L(j) for every j in exponents
+    """
+    sorted_data = __sorted__(data)
 
-        def __quality__(d):
-            ind = points_to_qualify.index(d)
-            return interest_qualities[ind]
+    def quality(points):
+        less_than = np.searchsorted(sorted_data, points.ravel(), 'left').reshape(points.shape)
+        return np.minimum(len(sorted_data) - less_than, less_than)
 
-        start_point = [min(__quality__(x), __quality__(x+2**j-1))
-                       for x in points_of_interest if x <= max_range - 2**j + 1]
-        end_point = [min(__quality__(x-2**j+1), __quality__(x))
-                     for x in points_of_interest if x >= 2**j - 1]
-        return max(start_point+end_point)
+    points = np.unique(np.concatenate([np.floor(sorted_data), np.ceil(sorted_data)]))
+    lengths = (2 ** exponents - 1)[:, None]
+    qualities = quality(points)
+    start_point = np.where(points <= max_range - lengths, np.minimum(qualities, quality(points + lengths)), 0)
+    end_point = np.where(points >= lengths, np.minimum(quality(points - lengths), qualities), 0)
+    bounds = np.max(np.maximum(start_point, end_point), axis=1) if len(points) > 0 else np.zeros(len(exponents))
+    return np.where(exponents == 0, min_max_maximum_quality(sorted_data, 0, max_range), bounds)
+
+
+def min_max_intervals_bounding(data, max_range, j):
+    """
+    L(j) of the minmax quality - the maximum over the intervals of length 2^j in [0, max_range]
+    of the minimum quality in the interval
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param max_range: maximum possible output (the minimum output is 0)
+    :param j: interval length exponent
+    :return: L(j)
+    """
+    return __min_max_bounding__(data, max_range, np.array([j]))[0]
+
+
+def min_max_intervals_bounding_all(data, max_range, max_j):
+    """
+    L(j) of the minmax quality for all 0 <= j <= max_j at once
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param max_range: maximum possible output (the minimum output is 0)
+    :param max_j: maximal interval length exponent
+    :return: numpy array of L(j) for j = 0...max_j
+    """
+    return __min_max_bounding__(data, max_range, np.arange(max_j + 1))
 
 
 def __old_min_max_maximum_quality__(data, interval):
@@ -129,13 +222,17 @@ def __old_min_max_maximum_quality__(data, interval):
 
 
 def min_max_maximum_quality(data, interval_start, interval_length):
-    greater_than = iterlen(x for x in data if x > interval_start)
-    less_than = len(data) - greater_than
-    after_domain = iterlen(x for x in data if x > interval_start + interval_length)
-    while greater_than > less_than and greater_than > after_domain:
-        greater_than -= 1
-        less_than += 1
-    return min(less_than, greater_than)
+    """
+    the maximum minmax quality in the interval [interval_start, interval_start + interval_length]
+    :return: the maximum quality
+    """
+    sorted_data = __sorted__(data)
+    greater_than = len(sorted_data) - np.searchsorted(sorted_data, interval_start, 'right')
+    less_than = len(sorted_data) - greater_than
+    after_domain = len(sorted_data) - np.searchsorted(sorted_data, interval_start + interval_length, 'right')
+    # moving inside the interval passes points from above to below, as long as it improves the quality
+    steps = max(0, min(-((less_than - greater_than) // 2), greater_than - after_domain))
+    return min(less_than + steps, greater_than - steps)
 
 
 def point_in_interval(point, interval):
@@ -143,7 +240,15 @@ def point_in_interval(point, interval):
 
 
 def points_in_subset(data, subset):
-    return len([i for i in data if point_in_interval(i, subset)])
+    """
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param subset: interval (start, end) both inclusive
+    :return: the number of data points in the interval
+    """
+    if isinstance(data, SortedDataIndex):
+        return int(data.count(subset[0], subset[1]))
+    data = np.asarray(data)
+    return np.count_nonzero((subset[0] <= data) & (data <= subset[1]))
 
 
 # TODO no so efficient
@@ -163,48 +268,108 @@ def point_count_intervals_bounding2(data, interval, j):
     return max_points_in_interval
 
 
+def point_count_table(data, max_j):
+    """
+    precompute over the sorted data, for every data point d and every 0 <= j <= max_j,
+    the amount of points in the window [d, d + 2^j - 1]
+    a window of maximum points inside an interval can always be taken to start at a data point, or to end at the
+    end of the interval, so every query is two binary searches and a maximum over a slice of the table
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param max_j: maximal window size exponent in the table (-1 for an empty table).
+    larger exponents are computed (and kept in the table) when queried
+    :return: function bounding(interval, j) which returns the maximum amount of points in any window of length 2^j
+    inside the interval (same as point_count_intervals_bounding(data, interval, j))
+    """
+    points = __sorted__(data)
+    starts = np.searchsorted(points, points, 'left')
+
+    def window_counts(exponents):
+        lengths = 2 ** np.asarray(exponents)
+        ends = np.searchsorted(points, (points + (lengths - 1)[:, None]).ravel(), 'right')
+        return dict(zip(exponents, ends.reshape(len(lengths), len(points)) - starts))
+
+    counts = window_counts(range(max_j + 1))
+
+    def bounding(interval, j):
+        if j == -1:
+            return 0
+        low = np.searchsorted(points, interval[0], 'left')
+        high = np.searchsorted(points, interval[1], 'right')
+        # windows which start after 'full' pass the end of the interval
+        full = max(low, min(high, np.searchsorted(points, interval[1] - 2**j + 1, 'right')))
+        if j not in counts:
+            counts.update(window_counts([j]))
+        row = counts[j]
+        best = np.max(row[low:full]) if full > low else 0
+        return int(max(best, high - full))
+    return bounding
+
+
 def point_count_intervals_bounding(data, interval, j):
-    if j == -1:
-        return 0
-    data_in_interval = [i for i in data if point_in_interval(i, interval)]
-    if len(data_in_interval) == 0:
-        return 0
-    data_que = deque(sorted(data_in_interval))
-    start, end = interval[0], min(interval[1], interval[0]+2**j - 1)
-    interval_remain = (end + 1, interval[1])
-    points_remain = [i for i in data_in_interval if point_in_interval(i, interval_remain)]
-    points_remain_que = deque(sorted(points_remain))
-    curr_interval = (start, end)
-    max_pis = pis = points_in_subset(data, curr_interval)
-    if len(points_remain) == 0:
-        return max_pis
-    # checks if the sub-lists sum-up to the entire list
-    # assert sum([i in points_remain for i in data])==len(data_in_interval)-pis
-    next_in = data_que.popleft()
-    next_out = points_remain_que.popleft()
-    start_in_data, end_in_data = start in data_in_interval,  end in data_in_interval
-    dist_to_next_in, dist_to_next_out = next_in - start, next_out - end
-    while len(points_remain_que) > 0:
-        if dist_to_next_in < dist_to_next_out:
-            pis -= int(start_in_data)
-            start_in_data, end_in_data = True, False
-            start = next_in
-            next_in = data_que.popleft()
-            end = start + 2**j - 1
-            dist_to_next_in, dist_to_next_out = next_in - start, next_out - end
-        else:
-            pis += int(not start_in_data)
-            max_pis = max(pis, max_pis)
-            end = next_out
-            next_out = points_remain_que.popleft()
-            start = end - 2**j + 1
-            if dist_to_next_in == dist_to_next_out:
-                start_in_data, end_in_data = True, True
-                next_in = data_que.popleft()
-            else:
-                start_in_data, end_in_data = False, True
-            dist_to_next_in, dist_to_next_out = next_in - start, next_out - end
-    return max_pis
+    """
+    the maximum amount of points in any window of length 2^j inside the interval
+    to answer many queries over the same data use point_count_table instead
+    :param data: list or numpy array of numbers, or a SortedDataIndex
+    :param interval: (start, end) both inclusive
+    :param j: window size exponent. -1 for an empty window
+    :return: the maximum amount of points
+    """
+    if isinstance(data, SortedDataIndex):
+        return data.max_window(interval, j)
+    return point_count_table(data, -1)(interval, j)
+
+
+def point_count(points, weights=None):
+    """
+    count (or sum the weights of) the appearances of every point, once for the whole data set
+    only the distinct points are kept, the rest of the domain has an implicit zero count
+    :param points: list or numpy array of points, or a SortedDataIndex
+    :param weights: None to count the points, or list or numpy array of a weight for every point
+    :return: function counts(domain) which returns a numpy array of the counts of the domain elements
+    """
+    points = __sorted__(points) if weights is None else np.asarray(points)
+    values, inverse = np.unique(points, return_inverse=True)
+    totals = np.bincount(inverse, weights, max(1, len(values)))
+
+    def counts(domain):
+        domain = __as_array__(domain)
+        if len(values) == 0:
+            return np.zeros(domain.shape, totals.dtype)
+        indices = np.minimum(np.searchsorted(values, domain), len(values) - 1)
+        return np.where(values[indices] == domain, totals[indices], 0)
+    return counts
+
+
+def bulk_quality_mode(data, domain):
+    """
+    sensitivity-1 bulk quality function
+    the quality_mode of every domain element at once
+    :return: numpy array of the number of appearances of every domain element in the data
+    """
+    return point_count(data)(domain)
+
+
+def bulk_quality_point_mode(data, domain):
+    """
+    sensitivity-1 bulk quality function
+    the quality_point_mode of every domain element at once
+    :param data: labeled sample - list of indexes and list of their labels
+    :return: numpy array of the number of times (domain element, 1) appears in the data
+    """
+    labels = np.asarray(data[1])
+    return point_count(np.asarray(data[0])[labels == 1])(domain)
+
+
+def bulk_point_concept_quality(data, domain):
+    """
+    sensitivity-1 bulk quality function
+    the point_concept_quality of every point concept in the domain at once
+    :param data: labeled sample from a POINT_d data set.
+                represented as list of indexes and list of their values in the original data set
+    :param domain: point concept indexes
+    :return: numpy array of the sums of the labels of every point in the data
+    """
+    return point_count(data[0], np.asarray(data[1], float))(domain)
 
 
 # TODO not in use!
@@ -250,6 +415,23 @@ def interval_threshold_quality(sampled_data, threshold_index):
                 (ys[i] == 1 and xs[i] < threshold_index) for i in xrange(len(xs))])
 
 
+def bulk_interval_threshold_quality(sampled_data, domain):
+    """
+    sensitivity-1 bulk quality function
+    the interval_threshold_quality of every threshold in the domain at once.
+    the sample is sorted once, and the agreeing points are counted by binary search - O((n+|D|)log(n))
+    :param sampled_data: two lists of the same length - one of x's and one of y's (labels 0 or 1)
+    :param domain: list, xrange or numpy array of thresholds
+    :return: numpy array of the number of points which agree with every threshold (in the order of the domain)
+    """
+    xs = np.asarray(sampled_data[0])
+    ys = np.asarray(sampled_data[1])
+    # points labeled 0 agree with thresholds up to x, points labeled 1 with thresholds above x
+    zeros_below = __count_below__(xs[ys == 0], domain)
+    ones_below = __count_below__(xs[ys == 1], domain)
+    return np.count_nonzero(ys == 0) - zeros_below + ones_below
+
+
 # second approach
 def threshold_function(index, threshold):
     if index < threshold:
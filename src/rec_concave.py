@@ -4,25 +4,203 @@ generic but not efficient
 """
 import basicdp
 import math
+import numpy as np
 import matplotlib.pyplot as plt
+from rng import get_rng
 
 
-def __rec_concave_basis__(range_max_value, quality_function, eps, data, bulk=False):
+def __rec_concave_basis__(range_max_value, quality_function, eps, data, bulk=False, rng=None):
     """recursion basis for the reconcave procedure - execute the exponential mechanism
+    the solution set is streamed, so it is never held in memory as a whole
     note that the parameters r,alpha,delta and N are not being used
     reconcave_basis(solution set size, quality function of sensitivity 1, eps privacy parameter, solution set)
     """
-    return basicdp.exponential_mechanism(data, range(int(range_max_value)+1), quality_function, eps, bulk)
+    return basicdp.exponential_mechanism_stream(data, xrange(int(range_max_value)+1), quality_function, eps, bulk,
+                                                rng=rng)
+
+
+def __segment_of__(starts, points):
+    """
+    :param starts: sorted numpy array of the starts of consecutive segments
+    :param points: number or numpy array of numbers
+    :return: the indexes of the segments which contain the points
+    """
+    return np.searchsorted(starts, points, 'right') - 1
+
+
+def __intervals_bounds__(qualities, log_of_range):
+    """
+    L(j) for all 0 <= j <= log_of_range+1 at once: the minimums over the windows of 2^j elements are the minimums of
+    pairs of overlapping windows of 2^(j-1) elements, so every level is computed out of the previous one
+    O(range*log(range))
+    :param qualities: the qualities of the 2^log_of_range elements
+    :param log_of_range: log of the number of elements
+    :return: numpy array of L(j)
+    """
+    windows_minimum = np.asarray(qualities, float)
+    bounds = [np.max(windows_minimum)]
+    for j in xrange(1, log_of_range + 1):
+        windows_minimum = np.minimum(windows_minimum[:-2**(j-1)], windows_minimum[2**(j-1):])
+        bounds.append(np.max(windows_minimum))
+    bounds.append(min(0, bounds[log_of_range]))
+    return np.array(bounds)
+
+
+def __segments_bounds__(starts, lengths, qualities, log_of_range):
+    """
+    L(j) for all 0 <= j <= log_of_range+1 of a quality which is constant on every segment.
+    the best window of 2^j elements has the quality of some segment as its minimum, and it fits inside the maximal run
+    of segments around that segment whose qualities are at least as high. so L(j) is the maximal quality of a segment
+    whose run is at least 2^j elements long. the runs are found by the 'nearest smaller value' stack - O(segments)
+    :param starts, lengths: numpy arrays of consecutive segments from 0
+    :param qualities: numpy array of the quality on every segment
+    :param log_of_range: the segments cover exactly 2^log_of_range elements
+    :return: numpy array of L(j)
+    """
+    segment_qualities = qualities.tolist()
+    count = len(segment_qualities)
+    # the first and the last segments of every run - next to the nearest segments with smaller qualities
+    run_firsts, run_lasts = np.zeros(count, int), np.zeros(count, int)
+    stack = []
+    for i in xrange(count):
+        while stack and segment_qualities[stack[-1]] >= segment_qualities[i]:
+            stack.pop()
+        run_firsts[i] = stack[-1] + 1 if stack else 0
+        stack.append(i)
+    stack = []
+    for i in xrange(count - 1, -1, -1):
+        while stack and segment_qualities[stack[-1]] >= segment_qualities[i]:
+            stack.pop()
+        run_lasts[i] = stack[-1] - 1 if stack else count - 1
+        stack.append(i)
+    run_lengths = starts[run_lasts] + lengths[run_lasts] - starts[run_firsts]
+    bounds = [np.max(qualities[run_lengths >= 2**j]) for j in xrange(log_of_range + 1)]
+    bounds.append(min(0, bounds[log_of_range]))
+    return np.array(bounds)
+
+
+def __candidate_intervals__(starts, lengths, offset, interval_length):
+    """
+    the intervals [offset + k*interval_length, offset + (k+1)*interval_length) which may be one of the two best
+    intervals: those which contain the start of a segment, the first two intervals inside every segment and the last
+    interval (which may be cut by the end of the segments). any other interval is inside a segment, and has the same
+    quality as two of the candidates
+    :param starts, lengths: numpy arrays of consecutive segments
+    :param offset: start of the first interval
+    :param interval_length: length of the intervals
+    :return: sorted numpy array of the starts of the candidate intervals
+    """
+    ends = starts + lengths
+    relevant = ends > offset
+    segment_starts, segment_ends = np.maximum(starts[relevant], offset) - offset, ends[relevant] - offset
+    containing = segment_starts // interval_length
+    first_inside = -(-segment_starts // interval_length)
+    last_inside = segment_ends // interval_length - 1
+    inside = [first_inside[first_inside <= last_inside], first_inside[first_inside + 1 <= last_inside] + 1]
+    last = [(segment_ends[-1:] - 1) // interval_length]
+    return offset + np.unique(np.concatenate([containing] + inside + last)) * interval_length
+
+
+def __clip_segments__(starts, lengths, begin, end):
+    """
+    :param starts, lengths: numpy arrays of consecutive segments
+    :param begin, end: the interval [begin, end)
+    :return: starts and lengths of the parts of the segments inside the interval
+    """
+    first, last = __segment_of__(starts, [begin, end - 1])
+    clipped_starts = np.maximum(starts[first:last + 1], begin)
+    clipped_ends = np.minimum(starts[first:last + 1] + lengths[first:last + 1], end)
+    return clipped_starts, clipped_ends - clipped_starts
+
+
+def __evaluate_segments__(data, range_max_value, quality_function, quality_promise,
+                          approximation, eps, delta, recursion_bound, segments, rng):
+    """
+    rec_concave over a huge range of integers, without materializing it:
+    the same steps as evaluate, on the segments on which the quality is constant (see evaluate)
+    memory and run-time are O(segments*log(range)) instead of O(range)
+    """
+    starts, lengths = segments(data, range_max_value)
+    if recursion_bound == 1 or range_max_value <= 32:
+        return basicdp.exponential_mechanism_segments(data, (starts, lengths), quality_function, eps, rng=rng)
+    recursion_bound -= 1
+
+    # step 2
+    log_of_range = (int(range_max_value) - 1).bit_length()
+    range_max_value_tag = 2 ** log_of_range
+    qualities = np.asarray(quality_function(data, starts), float)
+    # the segments are made to cover exactly [0, range_max_value_tag)
+    if range_max_value_tag > range_max_value + 1:
+        starts = np.append(starts, np.int64(range_max_value) + 1)
+        lengths = np.append(lengths, np.int64(range_max_value_tag - range_max_value - 1))
+        qualities = np.append(qualities, min(0, qualities[-1]))
+    elif range_max_value_tag == range_max_value:
+        lengths[-1] -= 1
+        if lengths[-1] == 0:
+            starts, lengths, qualities = starts[:-1], lengths[:-1], qualities[:-1]
+
+    def extended_quality_function(data_set, points):
+        return qualities[__segment_of__(starts, points)]
+
+    # step 3
+    bounds = __segments_bounds__(starts, lengths, qualities, log_of_range)
+
+    # step 4
+    def recursive_quality_function(data_base, range_elements):
+        range_elements = np.asarray(range_elements)
+        return np.minimum(bounds[range_elements] - (1 - approximation) * quality_promise,
+                          quality_promise - bounds[range_elements + 1])
+
+    # step 5
+    recursive_quality_promise = quality_promise * approximation / 2
+
+    # step 6 - recursion call (the range of the recursion is small, so it is evaluated directly)
+    recursion_returned = evaluate(data, log_of_range, recursive_quality_function, recursive_quality_promise, 1/4,
+                                  eps, delta, recursion_bound, True, rng)
+    good_interval = 8 * (2 ** recursion_returned)
+
+    # step 7 + 8 - the intervals are described by their starts, and qualified only if they may be the best ones
+    # step 9 ( using 'dist' algorithm)
+    chosen_intervals = []
+    for offset in [0, good_interval / 2]:
+        candidates = __candidate_intervals__(starts, lengths, offset, good_interval)
+        first_segments = __segment_of__(starts, candidates)
+        last_segments = __segment_of__(starts, np.minimum(candidates + good_interval, range_max_value_tag) - 1)
+        interval_qualities = np.array([qualities[first:last + 1].max()
+                                       for first, last in zip(first_segments, last_segments)])
+
+        def interval_quality(data_base, interval_starts):
+            return interval_qualities[np.searchsorted(candidates, interval_starts)]
+
+        chosen_intervals.append(basicdp.a_dist(data, candidates.tolist(), interval_quality, eps, delta, True,
+                                               rng=rng))
+
+    if any(type(chosen) == str for chosen in chosen_intervals):
+        raise ValueError('stability problem')
+
+    # step 10
+    chosen_segments = [__clip_segments__(starts, lengths, chosen, min(chosen + good_interval, range_max_value_tag))
+                       for chosen in chosen_intervals]
+    return basicdp.exponential_mechanism_segments(data, [np.concatenate(parts) for parts in zip(*chosen_segments)],
+                                                  extended_quality_function, eps, rng=rng)
 
 
 # A. Beimel, K. Nissim, and U. Stemmer. Private learning and sanitization
 def evaluate(data, range_max_value, quality_function, quality_promise,
-             approximation, eps, delta, recursion_bound, bulk=False):
+             approximation, eps, delta, recursion_bound, bulk=False, rng=None, segments=None):
     # TODO fix so it will work
     # TODO add docstring
     # TODO go through variables names
+    # segments - for huge ranges. function that gets the data and range_max_value and returns the starts and lengths
+    # of the segments of [0, range_max_value] on which quality_function is constant (e.g. qualities.rank_segments).
+    # quality_function is then a bulk one, and the range is never materialized
+    # a seed is turned into a generator once, so the recursion and the A_dist calls do not repeat the same noise
+    rng = get_rng(rng)
+    if segments is not None:
+        return __evaluate_segments__(data, range_max_value, quality_function, quality_promise,
+                                     approximation, eps, delta, recursion_bound, segments, rng)
     if recursion_bound == 1 or range_max_value <= 32:
-        return __rec_concave_basis__(range_max_value, quality_function, eps, data, bulk)
+        return __rec_concave_basis__(range_max_value, quality_function, eps, data, bulk, rng)
     else:
         recursion_bound -= 1
 
@@ -32,7 +210,7 @@ def evaluate(data, range_max_value, quality_function, quality_promise,
     range_max_value_tag = 2 ** log_of_range
 
     if bulk:
-        qualities = quality_function(data, range(int(range_max_value)+1))
+        qualities = list(quality_function(data, range(int(range_max_value)+1)))
     else:
         qualities = [quality_function(data, i) for i in range(int(range_max_value)+1)]
     qualities.extend([min(0, qualities[range_max_value]) for _ in xrange(range_max_value, range_max_value_tag)])
@@ -46,19 +224,19 @@ def evaluate(data, range_max_value, quality_function, quality_promise,
 
     # step 3
     print "step 3"
+    bounds = __intervals_bounds__(qualities[:range_max_value_tag], log_of_range)
 
     def intervals_bounding(j):
-        if j == log_of_range+1:
-            return min(0, intervals_bounding(log_of_range))
-        return max(min(extended_quality_function(e) for e in xrange(a, a+2**j-1))
-                   for a in xrange(0, range_max_value_tag-2**j+1))
+        return bounds[j]
 
     # step 4
     print "step 4"
 
-    def recursive_quality_function(data_base, range_element):
-        return min(intervals_bounding(range_element) - (1 - approximation) * quality_promise,
-                   quality_promise - intervals_bounding(range_element + 1))
+    # bulk quality function - range_elements can be a single element or a list of elements
+    def recursive_quality_function(data_base, range_elements):
+        range_elements = np.asarray(range_elements)
+        return np.minimum(intervals_bounding(range_elements) - (1 - approximation) * quality_promise,
+                          quality_promise - intervals_bounding(range_elements + 1))
 
     # step 5
     print "step 5"
@@ -67,7 +245,7 @@ def evaluate(data, range_max_value, quality_function, quality_promise,
     # step 6 - recursion call
     print "step 6 - recursive call"
     recursion_returned = evaluate(data, log_of_range, recursive_quality_function, recursive_quality_promise, 1/4,
-                                  eps, delta, recursion_bound, True)
+                                  eps, delta, recursion_bound, True, rng)
         
     good_interval = 8 * (2 ** recursion_returned)
     print "good interval: %d" % good_interval
@@ -96,8 +274,8 @@ def evaluate(data, range_max_value, quality_function, quality_promise,
 
     # step 9 ( using 'dist' algorithm)
     print "step 9"
-    first_chosen_interval = basicdp.a_dist(data, first_intervals, interval_quality, eps, delta)
-    second_chosen_interval = basicdp.a_dist(data, second_intervals, interval_quality, eps, delta)
+    first_chosen_interval = basicdp.a_dist(data, first_intervals, interval_quality, eps, delta, rng=rng)
+    second_chosen_interval = basicdp.a_dist(data, second_intervals, interval_quality, eps, delta, rng=rng)
 
     print "first A_dist returned: %s" % str(type(first_chosen_interval))
     print "second A_dist returned: %s" % str(type(second_chosen_interval))
@@ -108,4 +286,4 @@ def evaluate(data, range_max_value, quality_function, quality_promise,
     # step 10
     print "step 10"
     return basicdp.exponential_mechanism(data, first_chosen_interval + second_chosen_interval,
-                                         extended_quality_function_for_exponential_mechanism, eps, False)
\ No newline at end of file
+                                         extended_quality_function_for_exponential_mechanism, eps, False, rng=rng)
\ No newline at end of file
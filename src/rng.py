@@ -0,0 +1,117 @@
+"""
+random number generation for the private mechanisms
+every public procedure that draws noise gets an optional 'rng' parameter which can be:
+ a) None - numpy's global random state (the default, same as calling np.random directly)
+ b) int - a seed for a new numpy RandomState, so the results are reproducible
+ c) numpy RandomState or Generator, or any object with the same sampling methods (such as BufferedNoise)
+"""
+import numpy as np
+
+
+def get_rng(rng=None):
+    """
+    get a random generator out of the 'rng' parameter of the mechanisms
+    :param rng: None, int seed, or a random generator object
+    :return: random generator object with numpy's sampling methods (laplace, normal, uniform etc.)
+    """
+    if rng is None:
+        # the np.random module itself - its functions draw from numpy's global RandomState
+        return np.random
+    if isinstance(rng, (int, long, np.integer)):
+        return np.random.RandomState(rng)
+    return rng
+
+
+def spawn(rng, n):
+    """
+    create independent random generators out of a given one, e.g. one for every worker process
+    :param rng: None, int seed, or a random generator object
+    :param n: number of generators to create
+    :return: list of n independent random generators
+    """
+    rng = get_rng(rng)
+    if hasattr(rng, 'spawn'):
+        return rng.spawn(n)
+    # RandomState can be seeded by an array of 32-bit integers
+    seeds = randint(rng, 2**31, (n, 8))
+    return [np.random.RandomState(seed) for seed in seeds]
+
+
+def randint(rng, high, size=None):
+    """
+    uniformly random integers from [0, high) for both numpy's RandomState and Generator
+    :param rng: random generator object
+    :param high: upper bound (exclusive)
+    :param size: output shape. if None a single integer is returned
+    :return: random integer or numpy array of random integers
+    """
+    if hasattr(rng, 'integers'):
+        return rng.integers(high, size=size)
+    return rng.randint(high, size=size)
+
+
+class BufferedNoise(object):
+    """
+    random generator that draws the standard variates (laplace, normal, uniform, gumbel, exponential) in large
+    blocks, and hands them out shifted and scaled. so many small draws cost as much as a few big ones.
+    all other methods (binomial, permutation etc.) are passed to the underlying generator
+    """
+
+    def __init__(self, rng=None, block_size=2**16):
+        """
+        :param rng: None, int seed, or a random generator object to draw the blocks from
+        :param block_size: number of variates of each kind which are drawn at once
+        """
+        self.rng = get_rng(rng)
+        self.block_size = block_size
+        self.buffers = {}
+
+    def __standard__(self, kind, size):
+        """
+        draw a block of standard variates of the given kind from the underlying generator
+        :param kind: one of 'laplace', 'normal', 'uniform', 'gumbel', 'exponential'
+        :param size: number of variates
+        :return: numpy array of standard variates
+        """
+        if kind == 'exponential':
+            return self.rng.exponential(1, size)
+        return getattr(self.rng, kind)(0, 1, size)
+
+    def __take__(self, kind, size):
+        """
+        take standard variates out of the buffer of the given kind, and refill it if needed
+        :param kind: one of 'laplace', 'normal', 'uniform', 'gumbel', 'exponential'
+        :param size: output shape. if None a single value is returned
+        :return: standard variate or numpy array of standard variates
+        """
+        count = 1 if size is None else int(np.prod(size))
+        buffer, position = self.buffers.get(kind, (np.empty(0), 0))
+        if position + count > len(buffer):
+            buffer = np.concatenate([buffer[position:], self.__standard__(kind, max(self.block_size, count))])
+            position = 0
+        values = buffer[position:position + count]
+        self.buffers[kind] = buffer, position + count
+        if size is None:
+            return values[0]
+        return values.reshape(size)
+
+    def laplace(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self.__take__('laplace', size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self.__take__('normal', size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.__take__('uniform', size)
+
+    def gumbel(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self.__take__('gumbel', size)
+
+    def exponential(self, scale=1.0, size=None):
+        return scale * self.__take__('exponential', size)
+
+    def __getattr__(self, name):
+        # only called for attributes which are not defined here
+        if name == 'rng':
+            raise AttributeError(name)
+        return getattr(self.rng, name)
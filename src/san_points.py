@@ -1,16 +1,21 @@
 from basicdp import choosing_mechanism, choosing_mechanism_big
-from qualities import concept_query
-from examples import point_concept
-from numpy import log, log2, sqrt, ceil
-from numpy.random import laplace
-
-
-def __point_choice_quality__(subset):
-    def quality(samples, x):
-        if x in subset:
-            return sum(1 for s in samples if s == x)
-        else:
-            return 0
+from qualities import point_count
+from numpy import log, sqrt, in1d
+from collections import defaultdict
+from rng import get_rng
+
+
+def __point_choice_quality__(subset, counts):
+    """
+    bulk quality of choosing a point which was not chosen yet
+    :param subset: the points which were not chosen yet
+    :param counts: point_count of the samples
+    :return: bulk quality function - the number of appearances in the samples of the points of the subset, else 0
+    """
+    subset = list(subset)
+
+    def quality(samples, points):
+        return counts(points) * in1d(points, subset)
     return quality
 
 
@@ -21,7 +26,7 @@ def __counter_to_list__(counter):
     return c_list
 
 
-def sanitize(samples, alpha, beta, eps, delta):
+def sanitize(samples, alpha, beta, eps, delta, rng=None):
     """
 
     :param samples:
@@ -29,23 +34,28 @@ def sanitize(samples, alpha, beta, eps, delta):
     :param beta:
     :param eps:
     :param delta:
+    :param rng:
     :return:
     """
-    max_sample = max(samples)
-    dim = ceil(log2(max_sample + 1))
-    end_domain = 2**int(dim)
-    remaining_samples = set(range(end_domain))
-    est = dict.fromkeys(remaining_samples, 0)
+    rng = get_rng(rng)
+    # only points which appear in the samples have positive quality. the rest of the domain [0, 2^dim)
+    # is discarded by the choosing mechanism anyway, so it is never built (nor its estimations)
+    remaining_samples = set(samples)
+    counts = point_count(samples)
+    est = defaultdict(int)
     new_beta = alpha * beta / 4
     new_eps = eps / sqrt(32 * log(5/delta) / alpha)
     new_delta = alpha * delta / 5
     for i in range(int(2/alpha)):
-        q = __point_choice_quality__(remaining_samples)
-        b = choosing_mechanism_big(samples, remaining_samples, q, 1, alpha/2, new_beta, new_eps, new_delta)
+        if not remaining_samples:
+            break
+        q = __point_choice_quality__(remaining_samples, counts)
+        b = choosing_mechanism_big(samples, remaining_samples, q, 1, alpha/2, new_beta, new_eps, new_delta,
+                                   bulk=True, rng=rng)
         if b != 'bottom':
             remaining_samples.remove(b)
             # remaining_samples[b] -= 1
             # remaining_samples += Counter()
-            est[b] = concept_query(samples, point_concept(b)) + laplace(0, 1 / eps / len(samples), 1)[0]
+            est[b] = counts([b])[0] / float(len(samples)) + rng.laplace(0, 1 / eps / len(samples), 1)[0]
     return est
 
@@ -1,26 +1,29 @@
-from numpy.random import laplace
 from math import log, ceil
-from qualities import points_in_subset, point_count_intervals_bounding
+from qualities import points_in_subset, point_count_table, SortedDataIndex
 from basicdp import exponential_mechanism, choosing_mechanism
 from bounds import log_star
 from functools import partial
 from examples import __build_intervals_set__
 from collections import Counter
+from rng import get_rng
 
 
 calls = 0
 san_data = []
 
 
-def sanitize(samples, domain_range, alpha, beta, eps, delta):
+def sanitize(samples, domain_range, alpha, beta, eps, delta, rng=None):
     global calls
     calls = 77 / alpha
     domain_size = domain_range[1] - domain_range[0] + 1
     dim = int(ceil(log(domain_size, 2)))
-    return __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dim)
+    # the samples are sorted and their window counts are computed once, and shared by all the recursive calls
+    samples = SortedDataIndex(samples)
+    point_counts = point_count_table(samples, dim)
+    return __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dim, point_counts, get_rng(rng))
 
 
-def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension):
+def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension, point_counts, rng):
     # print domain_range
     # print calls
     global calls
@@ -33,7 +36,7 @@ def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension):
     # step 2
     # the use of partial is redundant
     samples_domain_points = partial(points_in_subset, samples)
-    noisy_points_in_range = samples_domain_points(subset=domain_range) + laplace(0, 1/eps, 1)
+    noisy_points_in_range = samples_domain_points(subset=domain_range) + rng.laplace(0, 1/eps, 1)
     sample_size = len(samples)
 
     # step 3
@@ -51,8 +54,8 @@ def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension):
     # step 6
 
     def quality(data, j):
-        return min(point_count_intervals_bounding(data, domain_range, j)-alpha * sample_size / 32,
-                3 * alpha * sample_size / 32 - point_count_intervals_bounding(data, domain_range, j-1))
+        return min(point_counts(domain_range, j)-alpha * sample_size / 32,
+                3 * alpha * sample_size / 32 - point_counts(domain_range, j-1))
 
     # not needed if using exponential_mechanism
     # step 7
@@ -62,7 +65,7 @@ def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension):
     new_eps = eps/3/log_star(dimension)
     # new_delta = delta/3/log_star(dimension)
     # note the use of exponential_mechanism instead of rec_concave
-    z_tag = exponential_mechanism(samples, range(log_size+1), quality, new_eps)
+    z_tag = exponential_mechanism(samples, range(log_size+1), quality, new_eps, rng=rng)
     z = 2 ** z_tag
 
     # step 9
@@ -73,28 +76,28 @@ def __rec_sanitize__(samples, domain_range, alpha, beta, eps, delta, dimension):
             return point_counter[b]
 
         b = choosing_mechanism(samples, range(domain_range[0], domain_range[1] + 1), special_quality,
-                               1, alpha/64., beta, eps, delta)
+                               1, alpha/64., beta, eps, delta, rng=rng)
         a = b
     # step 10
     else:
         first_intervals = __build_intervals_set__(samples, 2*z, domain_range[0], domain_range[1] + 1)
         second_intervals = __build_intervals_set__(samples, 2*z_tag, domain_range[0], domain_range[1] + 1, True)
         intervals = [(i, i+2*z-1) for i in first_intervals+second_intervals]
-        a, b = choosing_mechanism(samples, intervals, points_in_subset, 2, alpha/64., beta, eps, delta)
+        a, b = choosing_mechanism(samples, intervals, points_in_subset, 2, alpha/64., beta, eps, delta, rng=rng)
 
     if type(a) == str:
         raise ValueError("stability problem - choosing_mechanism returned 'bottom'")
 
     # step 11
     # although not mentioned I assume the noisy value should be rounded
-    noisy_count_ab = int(samples_domain_points((a, b)) + laplace(0, 1/eps, 1))
+    noisy_count_ab = int(samples_domain_points((a, b)) + rng.laplace(0, 1/eps, 1))
     san_data.extend([b] * noisy_count_ab)
 
     # step 12
     if a > domain_range[0]:
         rec_range = (domain_range[0], a - 1)
-        __rec_sanitize__(samples, rec_range, alpha, beta, eps, delta, dimension)
+        __rec_sanitize__(samples, rec_range, alpha, beta, eps, delta, dimension, point_counts, rng)
     if b < domain_range[1]:
         rec_range = (b + 1, domain_range[1])
-        __rec_sanitize__(samples, rec_range, alpha, beta, eps, delta, dimension)
+        __rec_sanitize__(samples, rec_range, alpha, beta, eps, delta, dimension, point_counts, rng)
     return san_data
@@ -1,10 +1,15 @@
 import unittest
 import src.basicdp
+import src.composition
 import math
+import itertools
+from functools import partial
+import gmpy2
 import numpy as np
 import matplotlib.pyplot as plt
 import src.examples
 import src.qualities
+import src.rng
 
 
 class TestBasicdp(unittest.TestCase):
@@ -77,6 +82,34 @@ class TestBasicdp(unittest.TestCase):
                                 src.qualities.quality_median(rand_data,
                                                     np.median(rand_data)) - difference)
 
+    def test_noisy_max_as_loop(self):
+        """tests the vectorized noisy_max and noisy_max_stream methods, with both noise types and the gap
+        :return: Pass if under the same seed they return the same element as adding the noise one element at a time,
+        also when the domain is streamed in chunks
+        """
+        rand_data = src.examples.get_random_data(self.DATA_SIZE)
+        range_set = range(-self.DOMAIN_SIZE, self.DOMAIN_SIZE)
+        qualities = [src.qualities.quality_median(rand_data, d) for d in range_set]
+        for noise in ['laplace', 'exponential']:
+            for seed in range(self.NUMBER_OF_ITERATIONS):
+                rng = np.random.RandomState(seed)
+                draw = partial(rng.laplace, 0) if noise == 'laplace' else rng.exponential
+                noisy = [q + draw(1 / self.eps) for q in qualities]
+                expected = range_set[noisy.index(max(noisy))]
+                result, gap = src.basicdp.noisy_max(rand_data, range_set, src.qualities.bulk_quality_median, self.eps,
+                                                    True, noise, True, seed)
+                self.assertEqual(result, expected)
+                self.assertAlmostEqual(gap, max(noisy) - sorted(noisy)[-2])
+                self.assertGreaterEqual(gap, 0)
+                for domain in [range_set, xrange(-self.DOMAIN_SIZE, self.DOMAIN_SIZE), (d for d in range_set)]:
+                    self.assertEqual(src.basicdp.noisy_max_stream(rand_data, domain, src.qualities.bulk_quality_median,
+                                                                  self.eps, True, chunk_size=7, noise=noise,
+                                                                  rng=seed), expected)
+        self.assertEqual(src.basicdp.noisy_max(rand_data, [0], src.qualities.quality_median, self.eps,
+                                               return_gap=True), (0, np.inf))
+        with self.assertRaises(ValueError):
+            src.basicdp.noisy_max(rand_data, range_set, src.qualities.quality_median, self.eps, noise='gaussian')
+
     def test_exponential_mechanism(self):
         """tests the exponential_mechanism method
         over a normally distributed data and mean quality function
@@ -104,6 +137,355 @@ class TestBasicdp(unittest.TestCase):
                                 src.qualities.quality_median(rand_data,
                                                     np.median(rand_data)) - difference)
 
+    def test_exponential_mechanism_large_qualities(self):
+        """tests that both exponential mechanisms agree on a domain with huge qualities
+        the weights of such a domain overflow a float unless computed in log-space
+        :return: Pass if both mechanisms return the only element with a much higher quality than the rest,
+        and the total weight of the domain, which is much larger than the largest float
+        """
+        range_set = range(self.DOMAIN_SIZE)
+        best = self.DOMAIN_SIZE / 2
+
+        def huge_quality(data, d):
+            return 10**6 if d == best else 10**6 - 100 / self.eps
+
+        log_weights = [self.eps * huge_quality(None, d) / 2 for d in range_set]
+        log_total_value = max(log_weights) + math.log(sum(math.exp(w - max(log_weights)) for w in log_weights))
+        for mechanism in [src.basicdp.exponential_mechanism, src.basicdp.exponential_mechanism_big]:
+            result, total_value = mechanism(None, range_set, huge_quality, self.eps, for_sparse=True)
+            self.assertEqual(result, best)
+            self.assertTrue(gmpy2.is_finite(total_value))
+            self.assertAlmostEqual(float(gmpy2.log(total_value)), log_total_value)
+
+    def test_exponential_mechanism_stream(self):
+        """tests the exponential_mechanism_stream method
+        over a normally distributed data and mean quality function, when the domain is given as a generator
+        :return: Pass if the exponential_mechanism_stream returns a relatively high value result
+        """
+        rand_data = src.examples.get_random_data(self.DATA_SIZE)
+        error_parameter = 10
+        difference = (2 / self.eps * (math.log(self.DOMAIN_SIZE) + error_parameter))
+
+        result = src.basicdp.exponential_mechanism_stream(rand_data, (d for d in xrange(-self.DOMAIN_SIZE,
+                                                                                         self.DOMAIN_SIZE)),
+                                                          src.qualities.bulk_quality_median, self.eps,
+                                                          bulk=True, chunk_size=self.DOMAIN_SIZE / 3)
+        print "The streaming Exponential Mechanism returned: %.2f" % result
+        self.assertGreaterEqual(src.qualities.quality_median(rand_data, result),
+                                src.qualities.quality_median(rand_data, np.median(rand_data)) - difference)
+
+    def test_exponential_mechanism_stream_distribution(self):
+        """tests the exponential_mechanism_stream method on a small domain which is streamed in chunks
+        :return: Pass if the frequencies of the results are close to the probabilities of the exponential mechanism
+        """
+        qualities = [0, 1, 3, 4, 4]
+        range_set = range(len(qualities))
+        weights = np.exp(self.eps * np.array(qualities) / 2.0)
+        probabilities = weights / weights.sum()
+
+        rng = np.random.RandomState(1)
+        results = [src.basicdp.exponential_mechanism_stream(None, (d for d in range_set), None, self.eps,
+                                                            qualities=qualities, chunk_size=2, rng=rng)
+                   for _ in range(20000)]
+        frequencies = np.bincount(results, minlength=len(qualities)) / 20000.0
+        print "expected: %s, frequencies: %s" % (probabilities, frequencies)
+        self.assertTrue(np.allclose(frequencies, probabilities, atol=0.015))
+
+    def test_prepared_exponential_mechanism(self):
+        """tests the prepared_exponential_mechanism method
+        over a normally distributed data and mean quality function
+        :return: Pass if all the NUMBER_OF_ITERATIONS draws return relatively high value results
+        """
+        rand_data = src.examples.get_random_data(self.DATA_SIZE)
+        range_set = range(-self.DOMAIN_SIZE, self.DOMAIN_SIZE)
+        error_parameter = 10
+        difference = (2 / self.eps * (math.log(self.DOMAIN_SIZE) + error_parameter))
+
+        sample = src.basicdp.prepared_exponential_mechanism(rand_data, range_set, src.qualities.bulk_quality_median,
+                                                            self.eps, True)
+        results = sample(self.NUMBER_OF_ITERATIONS)
+        self.assertEqual(len(results), self.NUMBER_OF_ITERATIONS)
+        worst_quality = min(src.qualities.quality_median(rand_data, r) for r in results)
+        print "The worst quality out of %d draws: %d\n" % (self.NUMBER_OF_ITERATIONS, worst_quality)
+        self.assertGreaterEqual(worst_quality,
+                                src.qualities.quality_median(rand_data, np.median(rand_data)) - difference)
+
+    def test_exponential_mechanism_segments(self):
+        """tests the exponential_mechanism_segments method
+        over a normally distributed data, a range of 2^50 integers and the median quality function
+        :return: Pass if the result lies in the range and has a relatively high quality
+        """
+        range_max_value = 2**50
+        rand_data = src.examples.get_random_data(self.DATA_SIZE, pivot=range_max_value / 2)
+        error_parameter = 10
+        difference = (2 / self.eps * (math.log(range_max_value) + error_parameter))
+
+        segments = src.qualities.rank_segments(rand_data, range_max_value)
+        self.assertEqual(sum(segments[1]), range_max_value + 1)
+        result = src.basicdp.exponential_mechanism_segments(rand_data, segments, src.qualities.bulk_quality_median,
+                                                            self.eps)
+        print "The segments Exponential Mechanism returned: %d" % result
+        self.assertTrue(0 <= result <= range_max_value)
+        self.assertGreaterEqual(src.qualities.quality_median(rand_data, result),
+                                src.qualities.quality_median(rand_data, np.median(rand_data)) - difference)
+
+    def test_permute_and_flip_distribution(self):
+        """tests the permute_and_flip method on a small domain, with and without the exact maximal quality
+        :return: Pass if the frequencies of the results are close to the probabilities computed over all the orders
+        for the exact maximal quality, and to the probabilities of the exponential mechanism for an upper bound
+        """
+        qualities = [0, 1, 3, 4]
+        range_set = range(len(qualities))
+
+        def quality(data, d):
+            return qualities[d]
+
+        rng = np.random.RandomState(1)
+        weights = [np.exp(self.eps * (q - max(qualities)) / 2.0) for q in qualities]
+        # Pr[d] = average over the orders of weight(d) * prod(1 - weight(c)) over the elements c before d
+        flip_probabilities = np.zeros(len(qualities))
+        orders = list(itertools.permutations(range_set))
+        for order in orders:
+            for position, d in enumerate(order):
+                flip_probabilities[d] += weights[d] * np.prod([1 - weights[c] for c in order[:position]]) / len(orders)
+        exponential_probabilities = np.array(weights) / sum(weights)
+        for max_quality, probabilities in [(None, flip_probabilities), (max(qualities) + 2, exponential_probabilities)]:
+            results = [src.basicdp.permute_and_flip(None, range_set, quality, self.eps, max_quality, rng=rng)
+                       for _ in range(20000)]
+            frequencies = np.bincount(results, minlength=len(qualities)) / 20000.0
+            print "expected: %s, frequencies: %s" % (probabilities, frequencies)
+            self.assertTrue(np.allclose(frequencies, probabilities, atol=0.015))
+
+    def test_permute_and_flip_lazy(self):
+        """tests that permute_and_flip evaluates only the qualities of the elements it visits
+        :return: Pass if a domain of 2^40 elements is not materialized, and the quality is evaluated once
+        for every visited element
+        """
+        evaluated = []
+
+        def quality(data, d):
+            evaluated.append(d)
+            return 10 if d % 2 else 0
+
+        result = src.basicdp.permute_and_flip(None, xrange(2**40), quality, self.eps, 10, rng=1)
+        self.assertEqual(result % 2, 1)
+        self.assertEqual(evaluated[-1], result)
+        self.assertEqual(len(set(evaluated)), len(evaluated))
+        self.assertLess(len(evaluated), 100)
+
+        evaluated[:] = []
+        src.basicdp.permute_and_flip(None, range(self.DOMAIN_SIZE), quality, self.eps, rng=1)
+        self.assertEqual(len(evaluated), self.DOMAIN_SIZE)
+
+    def test_top_k(self):
+        """tests the top_k method
+        over a domain in which k elements have a much higher quality than the rest
+        :return: Pass if top_k returns exactly those k elements and reports k*eps as its privacy parameter
+        """
+        k = 5
+        range_set = range(self.DOMAIN_SIZE)
+        best = set(range_set[::self.DOMAIN_SIZE / k])
+
+        def quality(data, d):
+            return 100 / self.eps if d in best else 0
+
+        result, privacy = src.basicdp.top_k(None, range_set, quality, self.eps, k)
+        self.assertEqual(set(result), best)
+        self.assertEqual(privacy, (k * self.eps, 0))
+
+    def test_top_k_distribution(self):
+        """tests the distribution of the top_k method on a small domain
+        :return: Pass if the frequencies of the ordered results are close to the probabilities of two rounds of the
+        exponential mechanism without replacement
+        """
+        qualities = [0, 1, 3, 4]
+        range_set = range(len(qualities))
+
+        def quality(data, d):
+            return qualities[d]
+
+        weights = np.exp(self.eps * np.array(qualities) / 2.0)
+        pairs = list(itertools.permutations(range_set, 2))
+        probabilities = [weights[a] / weights.sum() * weights[b] / (weights.sum() - weights[a]) for a, b in pairs]
+
+        rng = np.random.RandomState(1)
+        results = [tuple(src.basicdp.top_k(None, range_set, quality, self.eps, 2, rng=rng)[0]) for _ in range(20000)]
+        frequencies = [results.count(pair) / 20000.0 for pair in pairs]
+        print "expected: %s, frequencies: %s" % (np.round(probabilities, 3), np.round(frequencies, 3))
+        self.assertTrue(np.allclose(frequencies, probabilities, atol=0.015))
+
+    def test_top_k_privacy(self):
+        """tests the privacy parameters reported by top_k, with and without an accepted loss in delta
+        :return: Pass if the pure composition is reported unless delta_tag is given and the advanced composition
+        has a smaller eps
+        """
+        range_set = range(self.DOMAIN_SIZE)
+
+        def quality(data, d):
+            return d
+
+        delta_tag = 1e-6
+        # few rounds - the advanced composition is worse, so the pure one is kept
+        self.assertEqual(src.basicdp.top_k(None, range_set, quality, self.eps, 2, delta_tag=delta_tag)[1],
+                         (2 * self.eps, 0))
+        # many rounds of a small eps - the advanced composition is better, but only if delta_tag is accepted
+        eps, k = 0.01, 100
+        self.assertEqual(src.basicdp.top_k(None, range_set, quality, eps, k)[1], (k * eps, 0))
+        privacy = src.basicdp.top_k(None, range_set, quality, eps, k, delta_tag=delta_tag)[1]
+        self.assertEqual(privacy, src.composition.advanced(eps, 0, delta_tag, k))
+        self.assertLess(privacy[0], k * eps)
+        self.assertEqual(privacy[1], delta_tag)
+
+    def test_choosing_mechanism(self):
+        """tests the choosing_mechanism and choosing_mechanism_big methods, when the solution set is given as a set
+        :return: Pass if every quality is evaluated exactly once, the result has a quality of at least 1, and 'bottom'
+        is returned when all the qualities are far below alpha*n/2
+        """
+        data = range(self.DATA_SIZE)
+        solution_set = set(range(self.DOMAIN_SIZE))
+        calls = []
+
+        def quality(data_base, d):
+            calls.append(d)
+            return 0 if d % 3 else 50
+
+        for mechanism in [src.basicdp.choosing_mechanism, src.basicdp.choosing_mechanism_big]:
+            for seed in range(10):
+                del calls[:]
+                result = mechanism(data, solution_set, quality, 0.02, self.eps, check_bound=False, rng=seed)
+                self.assertEqual(sorted(calls), sorted(solution_set))
+                self.assertGreaterEqual(quality(data, result), 1)
+            self.assertEqual(mechanism(data, solution_set, quality, 1, self.eps, check_bound=False, rng=0), 'bottom')
+
+    def test_sparse_domain_progression(self):
+        """tests that sparse_domain picks zero-quality elements of a huge xrange domain
+        out of the positive set and on the progression
+        :return: Pass if none of the picks is a positive element or off the progression
+        """
+        domain = xrange(-2**40, 2**40, 3)
+        positive_value = range(-2**40, -2**40 + 3 * self.DOMAIN_SIZE, 3)
+
+        def quality(data, d):
+            return 0
+
+        for k in range(self.NUMBER_OF_ITERATIONS):
+            result = src.basicdp.sparse_domain(src.basicdp.exponential_mechanism, None, domain,
+                                               positive_value, quality, self.eps)
+            self.assertEqual((result + 2**40) % 3, 0)
+            self.assertTrue(result >= -2**40 + 3 * self.DOMAIN_SIZE or result in positive_value)
+
+    def test_sparse_domain_zero_weight(self):
+        """tests sparse_domain with the A_dist mechanism when the total quality of the positive set is 0
+        :return: Pass if it returns a zero-quality element instead of dividing by the zero weight
+        """
+        domain = range(self.DOMAIN_SIZE)
+        positive_value = [0, 1]
+
+        def quality(data, d):
+            return 50 if d == 0 else -50
+
+        for seed in range(self.NUMBER_OF_ITERATIONS):
+            result = src.basicdp.sparse_domain(src.basicdp.a_dist, None, domain, positive_value, quality, self.eps,
+                                               0.5, rng=seed)
+            self.assertNotIn(result, positive_value)
+
+    def test_seeded_rng(self):
+        """tests that the mechanisms are reproducible given a seed, also when the noise is buffered
+        :return: Pass if two runs with the same seed return the same results
+        """
+        range_set = range(self.DOMAIN_SIZE)
+        rand_data = src.examples.get_random_data(self.DATA_SIZE, pivot=self.DOMAIN_SIZE / 2)
+        quality = src.qualities.quality_median
+
+        def run(rng):
+            return [src.basicdp.exponential_mechanism(rand_data, range_set, quality, self.eps, rng=rng),
+                    src.basicdp.noisy_max(rand_data, range_set, quality, self.eps, rng=rng),
+                    src.basicdp.top_k(rand_data, range_set, quality, self.eps, 3, rng=rng)[0]]
+
+        self.assertEqual(run(np.random.RandomState(7)), run(np.random.RandomState(7)))
+        self.assertEqual(run(src.rng.BufferedNoise(7)), run(src.rng.BufferedNoise(7)))
+
+    def test_above_threshold_batched(self):
+        """tests that the batched and the streaming above_threshold find the same query as above_threshold
+        with the same seed. the noise of the i-th query is the i-th noise value in all of them
+        :return: Pass if all the versions return the index of the same query
+        """
+        data = src.examples.get_random_data(self.DATA_SIZE)
+        threshold = self.DATA_SIZE / 2
+
+        def count_below(t, data_set):
+            return np.sum(data_set < t)
+
+        # the number of data points below t is a sensitivity-1 query, above the threshold for large t
+        queries = [partial(count_below, t) for t in range(-self.DOMAIN_SIZE, self.DOMAIN_SIZE, 5)]
+        answers = [query(data) for query in queries]
+
+        found = 0
+        for seed in range(self.NUMBER_OF_ITERATIONS):
+            results = src.basicdp.above_threshold_on_queries(data, queries, threshold, self.eps, rng=seed)
+            expected = len(results) - 1 if results[-1] == 'up' else -1
+            found += expected != -1
+
+            batched = src.basicdp.above_threshold_batched(threshold, self.eps, seed)
+            batch_size = 8
+            index = -1
+            for start in range(0, len(answers), batch_size):
+                index = batched(answers[start:start + batch_size])
+                if index != -1:
+                    index += start
+                    break
+            self.assertEqual(index, expected)
+            self.assertEqual(src.basicdp.above_threshold_stream(data, queries, threshold, self.eps,
+                                                                chunk_size=batch_size, rng=seed), expected)
+        # the thresholds are crossed in the middle of the queries
+        self.assertGreater(found, 0)
+
+    def test_noisy_avgs(self):
+        """tests the noisy_avgs method on a full, a half and an empty group of vectors
+        :return: Pass if the averages of the non-empty groups are close to the exact ones, and the empty group
+        gets 'bottom'
+        """
+        dimension = 3
+        vectors = np.random.RandomState(0).uniform(-1, 1, (100 * self.DATA_SIZE, dimension))
+        masks = np.zeros((3, len(vectors)), dtype=bool)
+        masks[0] = True
+        masks[1, ::2] = True
+        averages = src.basicdp.noisy_avgs(vectors, masks, dimension, self.eps, 1e-6, rng=0)
+        self.assertEqual(len(averages), 3)
+        for mask, average in zip(masks[:2], averages[:2]):
+            self.assertTrue(np.allclose(average, vectors[mask].mean(axis=0), atol=0.01))
+        self.assertEqual(averages[2], 'bottom')
+        self.assertEqual(src.basicdp.noisy_avg(vectors, lambda v: False, dimension, self.eps, 1e-6, rng=0), 'bottom')
+        # with delta=2 the noisy size of an empty group is positive about half of the times
+        for seed in range(self.NUMBER_OF_ITERATIONS):
+            self.assertEqual(src.basicdp.noisy_avgs(vectors, masks[2:], dimension, self.eps, 2, rng=seed), ['bottom'])
+
+    def test_top_two(self):
+        """tests the single pass of A_dist over lists, xranges and generators, chunk by chunk
+        :return: Pass if the best element, the two highest qualities and the total quality are the same as sorting
+        all the qualities, A_dist returns the same under a seed, and a list domain is not changed
+        """
+        rng = np.random.RandomState(0)
+        for size in [2, 3, 50]:
+            # few distinct qualities, so the highest ones are tied in some of the domains
+            qualities = list(rng.randint(0, 5, size))
+
+            def quality(data, d):
+                return qualities[d]
+
+            best = qualities.index(max(qualities))
+            expected = (best, max(qualities), sorted(qualities)[-2], float(sum(qualities)))
+            range_set = range(size)
+            for chunk_size in [1, 2, 7, size]:
+                for domain in [lambda: range_set, lambda: xrange(size), lambda: (d for d in range_set)]:
+                    self.assertEqual(src.basicdp.__top_two__(None, domain(), quality, False, chunk_size), expected)
+                    self.assertEqual(src.basicdp.a_dist(None, domain(), quality, self.eps, 0.5, chunk_size=chunk_size,
+                                                        rng=size),
+                                     src.basicdp.a_dist(None, range(size), quality, self.eps, 0.5, rng=size))
+            self.assertEqual(range_set, range(size))
+        with self.assertRaises(ValueError):
+            src.basicdp.a_dist(None, [0], lambda data, d: 1, self.eps, 0.5)
+
     def test_dist(self):
         """tests the A_dist method
         over data sampled with replacements, from point_d data-set
@@ -0,0 +1,79 @@
+import unittest
+import src.bounds
+import numpy as np
+import math
+
+
+class TestBounds(unittest.TestCase):
+
+    def setUp(self):
+        self.eps = 0.5
+        self.delta = 1e-6
+        self.alpha = 0.1
+        self.beta = 0.1
+
+    def test_huge_domain_size(self):
+        """tests the bounds on domain sizes which do not fit into a 64-bit integer
+        :return: Pass if the bounds are the same as when computed by python's math module
+        """
+        self.assertAlmostEqual(src.bounds.step6_n2_bound(2**64, self.eps, self.alpha, self.beta),
+                               32 * math.log(64 / self.beta) / self.alpha / self.eps)
+        self.assertAlmostEqual(src.bounds.exponential_bound(self.eps, self.alpha, self.beta, 2**100),
+                               16 * math.log(100 / self.beta) / self.alpha / self.eps / 3)
+        self.assertEqual(src.bounds.log_star(2**80), 4)
+
+    def test_solve(self):
+        """tests the solve method on the eps of dist_bound, for several betas at once
+        :return: Pass if the returned values bracket the eps for which dist_bound equals the target
+        """
+        target = 1000
+        betas = np.linspace(0.01, 0.1, 10)
+        low, high = src.bounds.solve(src.bounds.dist_bound, 'eps', target, 1e-3, 10,
+                                     delta=self.delta, alpha=self.alpha, beta=betas)
+        self.assertEqual(low.shape, betas.shape)
+        self.assertTrue(np.all(src.bounds.dist_bound(high, self.delta, self.alpha, betas) <= target))
+        self.assertTrue(np.all(src.bounds.dist_bound(low, self.delta, self.alpha, betas) >= target))
+        self.assertTrue(np.all(high / low - 1 < 1e-9))
+
+    def test_solve_huge_domain_size(self):
+        """tests the solve method on the domain size of exponential_bound, in a range of huge domain sizes
+        :return: Pass if the domain size for the target bound of a 2^64 domain is found, and nan out of the range
+        """
+        target = src.bounds.exponential_bound(self.eps, self.alpha, self.beta, 2**64)
+        low, high = src.bounds.solve(src.bounds.exponential_bound, 'domain_size', [target, 10 * target], 2, 2**100,
+                                     eps=self.eps, alpha=self.alpha, beta=self.beta)
+        # the bound grows like log(log(domain_size)), so the domain size is found only up to float precision
+        self.assertAlmostEqual(low[0] / 2**64, 1, places=9)
+        self.assertAlmostEqual(high[0] / 2**64, 1, places=9)
+        self.assertTrue(np.isnan(low[1]) and np.isnan(high[1]))
+
+    def test_minimum_eps(self):
+        """tests the minimum_eps method on the sample size of dist_bound
+        :return: Pass if the sample size for eps is enough for the returned eps, and nan when it is out of the range
+        """
+        target = src.bounds.dist_bound(self.eps, self.delta, self.alpha, self.beta)
+        result = src.bounds.minimum_eps(src.bounds.dist_bound, [target, 1e-9],
+                                        delta=self.delta, alpha=self.alpha, beta=self.beta)
+        self.assertAlmostEqual(result[0], self.eps)
+        self.assertLessEqual(src.bounds.dist_bound(result[0], self.delta, self.alpha, self.beta), target)
+        self.assertTrue(np.isnan(result[1]))
+
+    def test_maximum_dimension(self):
+        """tests the maximum_dimension method on the bounds of good_center and of the histograms
+        :return: Pass if the returned dimension is the largest one whose bound is at most the target
+        """
+        data_size = 2**40
+        target = src.bounds.good_center_points_in_cluster(data_size, 100, self.eps, self.delta, self.beta)
+        for points, dimension in [(target, 100), (target * 1.001, 100), (target * 0.999, 99)]:
+            self.assertEqual(src.bounds.maximum_dimension(src.bounds.good_center_points_in_cluster, points,
+                                                          data_size=data_size, eps=self.eps, delta=self.delta,
+                                                          beta=self.beta), dimension)
+        target = src.bounds.histograms_bound(1000, self.eps, self.delta)
+        self.assertEqual(src.bounds.maximum_dimension(src.bounds.histograms_bound, target, dimension_parameter='d',
+                                                      eps=self.eps, delta=self.delta), 1000)
+        self.assertTrue(np.isnan(src.bounds.maximum_dimension(src.bounds.histograms_bound, 1, dimension_parameter='d',
+                                                              eps=self.eps, delta=self.delta)))
+
+
+if __name__ == '__main__':
+    unittest.main()
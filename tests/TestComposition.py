@@ -0,0 +1,173 @@
+import unittest
+import shutil
+import tempfile
+import os
+import numpy as np
+import src.composition
+from math import exp
+from itertools import product
+
+
+def old_optimal_homogeneous(eps, delta, k):
+    """
+    the loop implementation of optimal_homogeneous, before the log-space computation
+    (with the denominator (1+exp(eps))^k of Kairouz, Oh, Viswanath)
+    """
+    for i in xrange(k/2 + 1):
+        sum_i = sum(src.composition.nCr(k, l)*(exp((k-l)*eps)-exp((k-2*i+l)*eps)) for l in xrange(i))
+        delta_i = sum_i/(1+exp(eps))**k
+        yield (k-2*i)*eps, 1-(1-delta_i)*(1-delta)**k
+
+
+def old_heterogeneous_delta(eps_list, delta_list, eps_g):
+    """
+    the minimal delta_g of the optimal heterogeneous composition by enumerating all the partitions (S, [1...k]-S),
+    as in the loop implementation of optimal_heterogeneous
+    """
+    eps_side = sum(max(0, exp(sum(e for e, s in zip(eps_list, part) if s))
+                       - exp(eps_g) * exp(sum(e for e, s in zip(eps_list, part) if not s)))
+                   for part in product([0, 1], repeat=len(eps_list)))
+    eps_side /= np.prod([1 + exp(e) for e in eps_list])
+    return 1 - (1 - eps_side) * np.prod([1 - d for d in delta_list])
+
+
+class TestComposition(unittest.TestCase):
+
+    def setUp(self):
+        self.eps_grid = [0.1, 0.2, 0.5]
+        self.k_grid = [10, 20, 40]
+        self.delta_grid = [1e-9, 1e-6, 1e-3]
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_homogeneous_table_round_trip(self):
+        """tests that a table saved by build_homogeneous_table is loaded by load_homogeneous_table
+        :return: Pass if the loaded table answers the queries on the grid exactly as optimal_homogeneous_eps
+        """
+        table = src.composition.build_homogeneous_table(self.path, self.eps_grid, self.k_grid, self.delta_grid)
+        self.assertEqual(table.shape, (3, 3, 3))
+        self.assertTrue(np.array_equal(np.load(os.path.join(self.path, 'table.npy')), table))
+        lookup = src.composition.load_homogeneous_table(self.path)
+        for eps in self.eps_grid:
+            for k in self.k_grid:
+                for delta_g in self.delta_grid:
+                    self.assertEqual(lookup(eps, 0, k, delta_g),
+                                     src.composition.optimal_homogeneous_eps(eps, 0, k, delta_g))
+
+    def test_homogeneous_table_conservative_rounding(self):
+        """tests the queries of load_homogeneous_table which are not on the grid
+        :return: Pass if the answers inside the grid are never below the exact ones,
+        and the answers outside of the grid are exact
+        """
+        src.composition.build_homogeneous_table(self.path, self.eps_grid, self.k_grid, self.delta_grid)
+        lookup = src.composition.load_homogeneous_table(self.path)
+        for eps, delta, k, delta_g in [(0.15, 0, 15, 1e-4), (0.3, 1e-12, 12, 1e-5), (0.11, 0, 39, 0.5)]:
+            exact = src.composition.optimal_homogeneous_eps(eps, delta, k, delta_g)
+            self.assertGreaterEqual(lookup(eps, delta, k, delta_g), exact)
+        for eps, delta, k, delta_g in [(1.0, 0, 10, 1e-6), (0.1, 0, 50, 1e-6), (0.1, 0, 10, 1e-12)]:
+            self.assertEqual(lookup(eps, delta, k, delta_g),
+                             src.composition.optimal_homogeneous_eps(eps, delta, k, delta_g))
+
+    def test_homogeneous_table_infinite_cell(self):
+        """tests that a query whose rounded cell is inf (delta_g too small for the grid) is computed exactly
+        :return: Pass if the answer is the exact optimal_homogeneous_eps
+        """
+        table = src.composition.build_homogeneous_table(self.path, self.eps_grid, self.k_grid, self.delta_grid)
+        table[:] = np.inf
+        np.save(os.path.join(self.path, 'table.npy'), table)
+        lookup = src.composition.load_homogeneous_table(self.path)
+        self.assertEqual(lookup(0.2, 0, 20, 1e-3), src.composition.optimal_homogeneous_eps(0.2, 0, 20, 1e-3))
+
+    def test_memo(self):
+        """tests the memo of the composition functions
+        :return: Pass if repeated calls return the memoized result, and the memo is bounded in size and in memory
+        """
+        eps_list, delta_list = [0.1, 0.2, 0.3, 0.4], [0, 1e-6, 0, 1e-6]
+        curve = src.composition.heterogeneous_curve(eps_list, delta_list)
+        self.assertIs(src.composition.heterogeneous_curve(eps_list, delta_list), curve)
+        self.assertIs(src.composition.heterogeneous_curve(tuple(eps_list), np.array(delta_list)), curve)
+        self.assertFalse(hasattr(src.composition.advanced, 'cache'))
+
+        calls = []
+
+        @src.composition.__memoize__(max_size=2, max_bytes=1000)
+        def zeros(size):
+            calls.append(size)
+            return np.zeros(size)
+
+        for size in [10, 20, 10, 30, 10, 20, 200, 200]:
+            zeros(size)
+        # 20 is dropped when 30 is added (least recently used), and 200 (1600 bytes) is never kept
+        self.assertEqual(calls, [10, 20, 30, 20, 200, 200])
+        self.assertLessEqual(len(zeros.cache), 2)
+
+    def test_optimal_homogeneous(self):
+        """tests the log-space optimal_homogeneous_curve, also through optimal_homogeneous
+        :return: Pass if it is the same as the loop implementation for small k, and for a large k (on which the loop
+        overflows) the deltas are probabilities that grow as the epsilons decrease
+        """
+        for eps in self.eps_grid + [1.0]:
+            for delta in [0, 1e-6]:
+                for k in range(1, 13):
+                    epsilons, deltas = src.composition.optimal_homogeneous_curve(eps, delta, k)
+                    expected = list(old_optimal_homogeneous(eps, delta, k))
+                    self.assertEqual(len(epsilons), len(expected))
+                    self.assertTrue(np.allclose(epsilons, [e for e, _ in expected]))
+                    self.assertTrue(np.allclose(deltas, [d for _, d in expected], rtol=1e-9, atol=1e-15))
+                    self.assertEqual(list(src.composition.optimal_homogeneous(eps, delta, k)),
+                                     zip(epsilons, deltas))
+        # a single pure mechanism - the delta is 0 and not -0.
+        self.assertFalse(np.signbit(src.composition.optimal_homogeneous_curve(0.5, 0, 1)[1][0]))
+        epsilons, deltas = src.composition.optimal_homogeneous_curve(0.5, 1e-9, 5000)
+        self.assertTrue(np.all(np.isfinite(deltas)))
+        self.assertTrue(np.all((0 <= deltas) & (deltas <= 1)))
+        self.assertTrue(np.all(np.diff(deltas) >= 0))
+        self.assertTrue(np.all(np.diff(epsilons) < 0))
+
+    def test_heterogeneous_curve(self):
+        """tests the heterogeneous_curve, optimal_heterogeneous and find_eg methods
+        :return: Pass if the curve is the same as enumerating all the partitions, for single values and arrays of
+        eps_g, and the eps_g found by the binary search is legitimate and within its resolution of the minimal one
+        """
+        eps_lists = [[0.5], [0.1, 0.2, 0.3, 0.4], [0.3] * 5, [0.05, 1.0, 0.25, 0.25, 0.7, 0.01]]
+        for eps_list in eps_lists:
+            for delta_list in [[0] * len(eps_list), [1e-6] * len(eps_list)]:
+                total_eps = sum(eps_list)
+                curve = src.composition.heterogeneous_curve(eps_list, delta_list)
+                eps_gs = [-0.1, 0, 0.05, total_eps / 3, total_eps / 2, total_eps - 1e-9, total_eps, total_eps + 1]
+                expected = [old_heterogeneous_delta(eps_list, delta_list, eps_g) for eps_g in eps_gs]
+                self.assertTrue(np.allclose([curve(eps_g) for eps_g in eps_gs], expected, rtol=1e-9, atol=1e-15))
+                self.assertTrue(np.allclose(curve(np.array(eps_gs)), expected, rtol=1e-9, atol=1e-15))
+                for eps_g, delta_g in zip(eps_gs, expected):
+                    self.assertTrue(src.composition.optimal_heterogeneous(eps_list, delta_list, eps_g, delta_g + 1e-12))
+
+                delta_g, steps = 1e-3, 30
+                eps_g = src.composition.find_eg(eps_list, delta_list, delta_g, steps)
+                self.assertLessEqual(old_heterogeneous_delta(eps_list, delta_list, eps_g), delta_g)
+                self.assertGreater(old_heterogeneous_delta(eps_list, delta_list, eps_g - total_eps / 2**(steps - 1)),
+                                   delta_g)
+
+    def test_approximate_heterogeneous(self):
+        """tests the approximate_heterogeneous and approximate_heterogeneous_delta methods
+        :return: Pass if the approximate delta is never below the exact one, and gets closer to it as the precision
+        gets smaller
+        """
+        eps_list = [0.05, 1.0, 0.25, 0.25, 0.7, 0.01, 0.123]
+        delta_list = [0, 1e-6, 0, 0, 1e-7, 0, 0]
+        for eps_g in [0, 0.3, 1.0, 2.0]:
+            exact = old_heterogeneous_delta(eps_list, delta_list, eps_g)
+            errors = []
+            for precision in [1e-1, 1e-2, 1e-3, 1e-4]:
+                approximate = src.composition.approximate_heterogeneous_delta(eps_list, delta_list, eps_g, precision)
+                self.assertGreaterEqual(approximate, exact * (1 - 1e-9))
+                self.assertEqual(src.composition.approximate_heterogeneous(eps_list, delta_list, eps_g, exact,
+                                                                           precision), approximate <= exact)
+                errors.append(approximate - exact)
+            self.assertTrue(np.all(np.diff(errors) <= 1e-12), errors)
+            self.assertLess(errors[-1], 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
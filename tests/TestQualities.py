@@ -0,0 +1,219 @@
+import unittest
+import numpy as np
+import src.qualities
+from collections import deque
+
+
+def old_bulk_quality_minmax(data, domain):
+    """
+    the loop implementation of bulk_quality_minmax, before the binary search.
+    note that the data points equal to a domain element are counted above it (unlike in quality_minmax)
+    """
+    greater_than = len(data)
+    less_than = 0
+    domain_que = deque(sorted(data))
+    qualities = []
+    data_next = min(domain) - 1
+    while len(domain_que) > 0:
+        data_prev = data_next
+        data_next = domain_que.popleft()
+        qualities.append([min(greater_than, less_than)
+                          for i in domain if data_prev < i <= data_next])
+        greater_than -= 1
+        less_than += 1
+    qualities.append([min(greater_than, less_than)
+                      for i in domain if data_next < i])
+    return [item for sub_list in qualities for item in sub_list]
+
+
+def old_min_max_intervals_bounding(data, max_range, j):
+    """
+    the loop implementation of min_max_intervals_bounding, before the vectorization
+    """
+    if j == 0:
+        return src.qualities.__old_min_max_maximum_quality__(data, (0, max_range))
+    ceil_data = set(np.ceil(x) for x in data)
+    floor_data = set(np.floor(x) for x in data)
+    rounded_data = floor_data.union(ceil_data)
+    points_of_interest = [x for x in rounded_data if x >= 2**j - 1 or x <= max_range - 2**j + 1]
+    before = set(y - 2**j + 1 for y in points_of_interest if y >= 2**j - 1)
+    after = set(y + 2**j - 1 for y in points_of_interest if y <= max_range - 2**j + 1)
+    points_to_qualify = sorted(list(set(points_of_interest).union(before, after)))
+    if len(points_to_qualify) == 0:
+        return 0
+    interest_qualities = old_bulk_quality_minmax(data, points_to_qualify)
+
+    def quality(d):
+        return interest_qualities[points_to_qualify.index(d)]
+
+    start_point = [min(quality(x), quality(x + 2**j - 1)) for x in points_of_interest if x <= max_range - 2**j + 1]
+    end_point = [min(quality(x - 2**j + 1), quality(x)) for x in points_of_interest if x >= 2**j - 1]
+    return max(start_point + end_point)
+
+
+class TestQualities(unittest.TestCase):
+
+    def setUp(self):
+        self.DOMAIN_SIZE = 64
+        self.DATA_SIZE = 100
+        rng = np.random.RandomState(0)
+        # the edge cases: no data, all the points equal, and points on the ends of the domain
+        self.data_sets = {
+            'integers': list(rng.randint(0, self.DOMAIN_SIZE, self.DATA_SIZE)),
+            'floats': list(rng.uniform(-1, self.DOMAIN_SIZE, self.DATA_SIZE)),
+            'empty': [],
+            'equal': [self.DOMAIN_SIZE / 2] * self.DATA_SIZE,
+            'endpoints': [0] * (self.DATA_SIZE / 2) + [self.DOMAIN_SIZE - 1] * (self.DATA_SIZE / 2),
+        }
+        self.domains = [range(-1, self.DOMAIN_SIZE + 1), xrange(self.DOMAIN_SIZE), np.arange(0, self.DOMAIN_SIZE, 3)]
+
+    def __assert_bulk(self, bulk_quality_function, expected_qualities):
+        """
+        helper function that compares a bulk quality function with the expected qualities
+        over all the data sets and domains. the data is given also as a SortedDataIndex
+        :param expected_qualities: function that gets the data and the domain and returns the list of qualities
+        """
+        for name, data in self.data_sets.items():
+            for domain in self.domains:
+                expected = list(expected_qualities(data, domain))
+                self.assertEqual(list(bulk_quality_function(data, domain)), expected, name)
+                self.assertEqual(list(bulk_quality_function(src.qualities.SortedDataIndex(data), domain)),
+                                 expected, name)
+
+    def test_bulk_quality_median(self):
+        """tests the bulk_quality_median method
+        :return: Pass if it equals quality_median on every domain element
+        """
+        self.__assert_bulk(src.qualities.bulk_quality_median,
+                           lambda data, domain: [src.qualities.quality_median(data, d) for d in domain])
+
+    def test_bulk_quality_minmax(self):
+        """tests the bulk_quality_minmax method
+        :return: Pass if it equals the loop implementation
+        """
+        self.__assert_bulk(src.qualities.bulk_quality_minmax, old_bulk_quality_minmax)
+
+    def test_point_count_table(self):
+        """tests the point_count_table method, also through point_count_intervals_bounding and SortedDataIndex
+        :return: Pass if the maximum number of points in a window of length 2^j inside an interval is the same as
+        the maximum over all the windows which start at a data point or at the start of the interval
+        """
+        intervals = [(0, self.DOMAIN_SIZE - 1), (10, 40), (-5, 5), (self.DOMAIN_SIZE - 4, self.DOMAIN_SIZE + 6),
+                     (20, 20), (self.DOMAIN_SIZE / 2, self.DOMAIN_SIZE / 2 + 1)]
+        for name, data in self.data_sets.items():
+            table = src.qualities.point_count_table(data, 3)
+            index = src.qualities.SortedDataIndex(data)
+            for interval in intervals:
+                for j in range(-1, 8):
+                    # a window with the maximum points can be moved right until it starts at a data point
+                    starts = [interval[0]] + [d for d in data if interval[0] <= d <= interval[1]]
+                    expected = max(src.qualities.points_in_subset(data, (a, min(a + 2**j - 1, interval[1])))
+                                   for a in starts) if j >= 0 else 0
+                    self.assertEqual(table(interval, j), expected, (name, interval, j))
+                    self.assertEqual(src.qualities.point_count_intervals_bounding(data, interval, j), expected)
+                    self.assertEqual(index.max_window(interval, j), expected)
+
+    def test_min_max_intervals_bounding(self):
+        """tests the min_max_intervals_bounding and min_max_intervals_bounding_all methods
+        :return: Pass if L(j) is the same as in the loop implementation for every j, together and one by one
+        """
+        max_range = self.DOMAIN_SIZE - 1
+        max_j = 7
+        for name, data in self.data_sets.items():
+            expected = [old_min_max_intervals_bounding(data, max_range, j) for j in range(max_j + 1)]
+            self.assertEqual(list(src.qualities.min_max_intervals_bounding_all(data, max_range, max_j)),
+                             expected, name)
+            index = src.qualities.SortedDataIndex(data)
+            self.assertEqual([src.qualities.min_max_intervals_bounding(index, max_range, j) for j in range(max_j + 1)],
+                             expected, name)
+
+    def test_min_max_maximum_quality(self):
+        """tests the closed form of min_max_maximum_quality
+        :return: Pass if it is the same as the loop implementation, for intervals inside and around the data
+        """
+        for name, data in self.data_sets.items():
+            for start in range(-2, self.DOMAIN_SIZE + 2, 3):
+                for length in [0, 1, 5, self.DOMAIN_SIZE / 2, self.DOMAIN_SIZE]:
+                    self.assertEqual(src.qualities.min_max_maximum_quality(data, start, length),
+                                     src.qualities.__old_min_max_maximum_quality__(data, (start, start + length)),
+                                     (name, start, length))
+
+    def test_bulk_interval_threshold_quality(self):
+        """tests the bulk_interval_threshold_quality method on samples labeled by a threshold, by random labels,
+        and by a single label
+        :return: Pass if it equals interval_threshold_quality on every threshold in the domain
+        """
+        rng = np.random.RandomState(1)
+        for name, data in self.data_sets.items():
+            xs = list(data)
+            labelings = {'threshold': [int(x < self.DOMAIN_SIZE / 3) for x in xs],
+                         'random': list(rng.randint(0, 2, len(xs))),
+                         'ones': [1] * len(xs)}
+            for labeling, ys in labelings.items():
+                for domain in self.domains:
+                    self.assertEqual(list(src.qualities.bulk_interval_threshold_quality((xs, ys), domain)),
+                                     [src.qualities.interval_threshold_quality((xs, ys), t) for t in domain],
+                                     (name, labeling))
+
+    def test_point_qualities(self):
+        """tests the point_count kernel through bulk_quality_mode, bulk_quality_point_mode and
+        bulk_point_concept_quality
+        :return: Pass if they equal quality_mode, quality_point_mode and point_concept_quality on every domain element
+        """
+        self.__assert_bulk(src.qualities.bulk_quality_mode,
+                           lambda data, domain: [src.qualities.quality_mode(data, d) for d in domain])
+        rng = np.random.RandomState(2)
+        for name, data in self.data_sets.items():
+            labeled = (list(data), list(rng.randint(0, 2, len(data))))
+            for domain in self.domains:
+                self.assertEqual(list(src.qualities.bulk_quality_point_mode(labeled, domain)),
+                                 [src.qualities.quality_point_mode(labeled, d) for d in domain], name)
+                self.assertEqual(list(src.qualities.bulk_point_concept_quality(labeled, domain)),
+                                 [src.qualities.point_concept_quality(labeled, d) for d in domain], name)
+                # only the weights of the points in the domain are counted
+                self.assertEqual(src.qualities.point_count(labeled[0], labeled[1])(domain).sum(),
+                                 sum(label for x, label in zip(*labeled) if x in set(domain)), name)
+
+    def test_sorted_data_index(self):
+        """tests the queries of SortedDataIndex and points_in_subset
+        :return: Pass if rank, count and points_in_subset equal counting the points one by one, on the data and on
+        an index of it, and the index is sorted and read only
+        """
+        intervals = [(0, self.DOMAIN_SIZE - 1), (10, 40), (-5, 5), (20, 20), (30, 10),
+                     (self.DOMAIN_SIZE / 2, self.DOMAIN_SIZE / 2), (self.DOMAIN_SIZE - 1, self.DOMAIN_SIZE + 6)]
+        for name, data in self.data_sets.items():
+            index = src.qualities.SortedDataIndex(data)
+            self.assertEqual(len(index), len(data))
+            self.assertEqual(list(index), sorted(data))
+            self.assertIs(src.qualities.SortedDataIndex(index).points, index.points)
+            with self.assertRaises(ValueError):
+                index.points[:1] = 0
+            for x in range(-1, self.DOMAIN_SIZE + 1):
+                self.assertEqual(index.rank(x), len([d for d in data if d < x]), (name, x))
+                self.assertEqual(index.rank(x, 'right'), len([d for d in data if d <= x]), (name, x))
+            for interval in intervals:
+                expected = len([d for d in data if interval[0] <= d <= interval[1]])
+                self.assertEqual(index.count(*interval), expected, (name, interval))
+                self.assertEqual(src.qualities.points_in_subset(data, interval), expected, (name, interval))
+                self.assertEqual(src.qualities.points_in_subset(index, interval), expected, (name, interval))
+
+    def test_rank_segments(self):
+        """tests the rank_segments method, also for a range of a single element
+        :return: Pass if the segments cover the range, and the number of points below an element is the same in every
+        segment and changes between segments
+        """
+        for name, data in self.data_sets.items():
+            for range_max_value in [0, 1, self.DOMAIN_SIZE / 2, self.DOMAIN_SIZE - 1, self.DOMAIN_SIZE + 5]:
+                starts, lengths = src.qualities.rank_segments(data, range_max_value)
+                self.assertEqual(starts[0], 0)
+                self.assertTrue(np.all(lengths > 0))
+                self.assertEqual(list(starts[1:]), list((starts + lengths)[:-1]))
+                self.assertEqual(starts[-1] + lengths[-1], range_max_value + 1)
+                ranks = [len([d for d in data if d < i]) for i in range(range_max_value + 1)]
+                segment_ranks = np.repeat([ranks[start] for start in starts], lengths)
+                self.assertEqual(list(segment_ranks), ranks, (name, range_max_value))
+                self.assertTrue(np.all(np.diff(segment_ranks[starts]) != 0), (name, range_max_value))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,10 +12,8 @@ class TestRecConcave(unittest.TestCase):
 
     def exact_median_interval(self, data, int_max_range):
         bulk_qualities = src.qualities.bulk_quality_minmax(data, range(0, int(int_max_range)))
-        max_quality = max(bulk_qualities)
-        first = bulk_qualities.index(max_quality)
-        last = (len(bulk_qualities) - 1) - bulk_qualities[::-1].index(max_quality)
-        return first, last
+        best = np.flatnonzero(bulk_qualities == np.max(bulk_qualities))
+        return best[0], best[-1]
 
     def setUp(self):
         self.range_end = 2**14
@@ -68,5 +66,120 @@ class TestRecConcave(unittest.TestCase):
         print "and its quality: %d \n" % result_quality
         self.assertLessEqual(np.abs(result_quality - self.maximum_quality), 10)
 
+
+class TestRecConcaveSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.alpha = 0.2
+        self.eps = 0.5
+        self.delta = 2**-14
+        self.RECURSION_BOUND = 2
+        self.NUMBER_OF_ATTEMPTS = 20
+
+    def __median_quality(self, data, range_end, seed, segments):
+        """
+        helper function that runs rec_concave with a seeded random generator
+        :return: the quality of the result, or None if A_dist failed because of a stability problem
+        """
+        try:
+            result = src.rec_concave.evaluate(data, range_end, src.qualities.bulk_quality_minmax, len(data) / 2,
+                                              self.alpha, self.eps, self.delta, self.RECURSION_BOUND, True,
+                                              rng=seed, segments=segments)
+        except ValueError:
+            return None
+        self.assertTrue(0 <= result <= range_end)
+        return src.qualities.quality_minmax(data, result)
+
+    def test_rec_concave_segments_as_dense(self):
+        print "testing that the segments give results of the same quality as the whole range"
+        range_end = 2**10
+        data = np.sort(np.random.RandomState(0).uniform(range_end/3, range_end/3*2, 1000))
+
+        for seed in range(self.NUMBER_OF_ATTEMPTS):
+            # the same noise is drawn up to the last step, which picks an element of the same quality
+            self.assertEqual(self.__median_quality(data, range_end, seed, src.qualities.rank_segments),
+                             self.__median_quality(data, range_end, seed, None))
+
+    def test_rec_concave_huge_range_median(self):
+        print "testing depth-2 to find median in a range of 2^60 integers"
+        range_end = 2**60
+        # A_dist needs a gap of log(1/delta)/eps between the two best intervals, which are much wider here.
+        # so the median is kept away from range_end/2 and its other dyadic points, which are ends of intervals
+        data = np.sort(np.random.RandomState(0).uniform(range_end/7, range_end/5, 3000))
+        maximum_quality = len(data) / 2
+        difference = 2 / self.eps * (np.log(range_end) + 10)
+
+        results = [self.__median_quality(data, range_end, seed, src.qualities.rank_segments)
+                   for seed in range(self.NUMBER_OF_ATTEMPTS)]
+        results = [result for result in results if result is not None]
+        print "%d out of %d attempts passed A_dist" % (len(results), self.NUMBER_OF_ATTEMPTS)
+        self.assertGreater(len(results), 0)
+        for result_quality in results:
+            self.assertLessEqual(maximum_quality - result_quality, difference)
+
+
+class TestRecConcaveBounds(unittest.TestCase):
+
+    def setUp(self):
+        self.LOG_OF_RANGE = 7
+        rng = np.random.RandomState(0)
+        size = 2**self.LOG_OF_RANGE
+        # the edge cases: all the qualities equal, and the highest qualities on the ends of the range
+        self.qualities = {
+            'random': rng.randint(-5, 50, size),
+            'equal': np.full(size, 3),
+            'median': src.qualities.bulk_quality_minmax(rng.uniform(0, size, 100), range(size)),
+            'endpoints': np.concatenate([[40, 40], np.zeros(size - 4, int), [30, 30]]),
+        }
+
+    def test_intervals_bounds(self):
+        print "testing L(j) by doubling against the minimums of all the windows"
+        for name, qualities in self.qualities.items():
+            qualities = list(qualities)
+            expected = [max(min(qualities[i:i + 2**j]) for i in range(len(qualities) - 2**j + 1))
+                        for j in range(self.LOG_OF_RANGE + 1)]
+            expected.append(min(0, expected[-1]))
+            self.assertEqual(list(src.rec_concave.__intervals_bounds__(qualities, self.LOG_OF_RANGE)), expected, name)
+
+    def __random_segments(self, rng, count):
+        """
+        helper function that splits the range into count random segments with random qualities
+        :return: the starts, lengths and qualities of the segments
+        """
+        size = 2**self.LOG_OF_RANGE
+        starts = np.union1d([0], rng.choice(np.arange(1, size), count - 1, replace=False))
+        lengths = np.diff(np.append(starts, size))
+        return starts, lengths, rng.randint(-5, 50, count).astype(float)
+
+    def test_segments_bounds(self):
+        print "testing L(j) of the segments against L(j) of the whole range"
+        rng = np.random.RandomState(1)
+        data = rng.uniform(0, 2**self.LOG_OF_RANGE, 100)
+        starts, lengths = src.qualities.rank_segments(data, 2**self.LOG_OF_RANGE - 1)
+        median = (starts, lengths, src.qualities.bulk_quality_minmax(data, starts).astype(float))
+        for segments in [median] + [self.__random_segments(rng, count) for count in [1, 2, 10, 2**self.LOG_OF_RANGE]]:
+            starts, lengths, qualities = segments
+            self.assertEqual(list(src.rec_concave.__segments_bounds__(starts, lengths, qualities, self.LOG_OF_RANGE)),
+                             list(src.rec_concave.__intervals_bounds__(np.repeat(qualities, lengths),
+                                                                       self.LOG_OF_RANGE)))
+
+    def test_candidate_intervals(self):
+        print "testing that the candidate intervals keep the two best intervals"
+        rng = np.random.RandomState(2)
+        size = 2**self.LOG_OF_RANGE
+        for count in [1, 2, 10, size]:
+            starts, lengths, qualities = self.__random_segments(rng, count)
+            dense = np.repeat(qualities, lengths)
+            for interval_length in [2**j for j in range(1, self.LOG_OF_RANGE + 1)]:
+                for offset in [0, interval_length / 2]:
+                    intervals = range(offset, size, interval_length)
+                    candidates = src.rec_concave.__candidate_intervals__(starts, lengths, offset, interval_length)
+                    self.assertTrue(set(candidates) <= set(intervals))
+                    interval_qualities = [dense[start:start + interval_length].max() for start in intervals]
+                    candidate_qualities = [dense[start:start + interval_length].max() for start in candidates]
+                    self.assertEqual(sorted(candidate_qualities)[-2:], sorted(interval_qualities)[-2:],
+                                     (count, interval_length, offset))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import src.rng
+
+
+class TestRng(unittest.TestCase):
+
+    def setUp(self):
+        self.SEED = 7
+        self.BLOCK_SIZE = 8
+
+    def test_get_rng(self):
+        """tests the get_rng method
+        :return: Pass if None draws from numpy's global random state, a seed gives a reproducible generator,
+        and a generator is returned as is
+        """
+        np.random.seed(self.SEED)
+        drawn = src.rng.get_rng(None).laplace(0, 1, 5)
+        np.random.seed(self.SEED)
+        self.assertTrue(np.array_equal(drawn, np.random.laplace(0, 1, 5)))
+        self.assertTrue(np.array_equal(src.rng.get_rng(self.SEED).laplace(0, 1, 5),
+                                       np.random.RandomState(self.SEED).laplace(0, 1, 5)))
+        rng = np.random.RandomState(self.SEED)
+        self.assertIs(src.rng.get_rng(rng), rng)
+        self.assertTrue(0 <= src.rng.randint(src.rng.get_rng(None), 10) < 10)
+
+    def test_spawn(self):
+        """tests the spawn method
+        :return: Pass if the same seed spawns the same generators, and the spawned generators draw different streams
+        """
+        first = [rng.uniform(0, 1, 10) for rng in src.rng.spawn(self.SEED, 3)]
+        second = [rng.uniform(0, 1, 10) for rng in src.rng.spawn(self.SEED, 3)]
+        self.assertEqual(len(first), 3)
+        for a, b in zip(first, second):
+            self.assertTrue(np.array_equal(a, b))
+        for i in range(3):
+            for j in range(i):
+                self.assertFalse(np.array_equal(first[i], first[j]))
+        self.assertEqual(len(src.rng.spawn(None, 2)), 2)
+
+    def test_buffered_noise(self):
+        """tests the BufferedNoise class, on draws that are smaller and larger than its blocks
+        :return: Pass if for every kind of noise, the values handed out across the refills of the buffer are the
+        same stream as drawing them directly from a generator with the same seed
+        """
+        sizes = [1, None, 5, 3, self.BLOCK_SIZE * 2 + 1, (2, 3), 2, None]
+        count = sum(1 if size is None else np.prod(size) for size in sizes)
+        draws = {
+            'laplace': (lambda rng, size: rng.laplace(1, 2, size), lambda rng: rng.laplace(1, 2, count)),
+            'normal': (lambda rng, size: rng.normal(1, 2, size), lambda rng: rng.normal(1, 2, count)),
+            'uniform': (lambda rng, size: rng.uniform(1, 3, size), lambda rng: rng.uniform(1, 3, count)),
+            'gumbel': (lambda rng, size: rng.gumbel(1, 2, size), lambda rng: rng.gumbel(1, 2, count)),
+            'exponential': (lambda rng, size: rng.exponential(2, size), lambda rng: rng.exponential(2, count)),
+        }
+        for kind, (draw, draw_all) in draws.items():
+            noise = src.rng.BufferedNoise(self.SEED, self.BLOCK_SIZE)
+            values = [draw(noise, size) for size in sizes]
+            for value, size in zip(values, sizes):
+                self.assertEqual(np.shape(value), () if size is None else np.empty(size).shape)
+            buffered = np.concatenate([np.ravel(value) for value in values])
+            self.assertTrue(np.allclose(buffered, draw_all(np.random.RandomState(self.SEED))), kind)
+        # the other methods are passed to the underlying generator
+        self.assertTrue(np.array_equal(src.rng.BufferedNoise(self.SEED).permutation(10),
+                                       np.random.RandomState(self.SEED).permutation(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()